@@ -0,0 +1,51 @@
+import io
+import os
+import zipfile
+
+CHUNK_SIZE = 1024 * 1024
+
+# Already-compressed formats are stored as-is; deflating them only burns CPU
+STORED_EXTENSIONS = {'.mkv', '.mp4', '.m4a', '.mp3', '.zip', '.jpg', '.png'}
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable stream that hands written bytes back to a generator."""
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+def _zip_info(arcname, path):
+    zinfo = zipfile.ZipInfo.from_file(path, arcname)
+    extension = os.path.splitext(arcname)[1].lower()
+    zinfo.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+    return zinfo
+
+def iter_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    Build a ZIP of (arcname, path) entries and yield it as a stream of byte chunks.
+    Files are read from disk chunk by chunk, so memory use stays flat however large the
+    archive is. The output can be passed straight to an upload or a Flask Response.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zip_file:
+        for arcname, path in entries:
+            # file_size is known up front, so zipfile switches to ZIP64 only when needed
+            with open(path, 'rb') as src, zip_file.open(_zip_info(arcname, path), 'w') as dest:
+                while True:
+                    chunk = src.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Central directory, written when the archive is closed
+    yield from sink.drain()
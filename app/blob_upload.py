@@ -0,0 +1,76 @@
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BLOCK_SIZE = 8 * 1024 * 1024
+
+class BlockUploader:
+    """
+    Uploads a stream of chunks to a block blob, staging blocks in parallel as soon as
+    each one fills up, then committing the block list.
+
+    At most `concurrency` blocks are in flight, so memory stays bounded at roughly
+    (concurrency + 1) * block_size while the producer keeps generating data. A failed
+    block is retried on its own without restarting the upload.
+    """
+    def __init__(self, block_size=DEFAULT_BLOCK_SIZE, concurrency=4, max_retries=3, backoff=1.0):
+        self.block_size = block_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    def _stage(self, blob_client, block_id, data):
+        for attempt in range(self.max_retries + 1):
+            try:
+                blob_client.stage_block(block_id, data, length=len(data))
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Staging block {block_id} failed, retrying: {e}")
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def upload(self, blob_client, chunks, content_type='application/zip'):
+        """Upload an iterable of byte chunks to blob_client and return the blob URL."""
+        from azure.storage.blob import BlobBlock, ContentSettings
+
+        block_ids = []
+        futures = []
+        errors = []
+        slots = threading.BoundedSemaphore(self.concurrency)
+
+        def stage(block_id, data):
+            try:
+                self._stage(blob_client, block_id, data)
+            except Exception as e:
+                errors.append(e)
+                raise
+            finally:
+                slots.release()
+
+        def submit(data):
+            # Fixed-width ids: Azure requires every block id in a blob to have the same length
+            block_id = base64.b64encode(f"{len(block_ids):08d}".encode()).decode()
+            block_ids.append(block_id)
+            slots.acquire()
+            futures.append(executor.submit(stage, block_id, bytes(data)))
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='upload') as executor:
+            buffer = bytearray()
+            for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.block_size:
+                    submit(buffer[:self.block_size])
+                    del buffer[:self.block_size]
+                if errors:
+                    # Fail fast instead of producing the rest of the archive
+                    raise errors[0]
+            if buffer:
+                submit(buffer)
+            for future in futures:
+                future.result()
+
+        blob_client.commit_block_list([BlobBlock(block_id=block_id) for block_id in block_ids],
+                                      content_settings=ContentSettings(content_type=content_type))
+        return blob_client.url
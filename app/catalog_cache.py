@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import metrics
+import http_client
+from pathlib import Path
+from search_index import SearchIndex
+from catalog_parser import parse_catalog_file
+
+CATALOG_URL = os.getenv('CATALOG_URL', 'https://app.jw-cdn.org/catalogs/media/E.json.gz')
+
+class CatalogIndex:
+    """
+    Lookup structures built once per catalog version.
+    """
+    def __init__(self, items):
+        self.items = items
+        self.search_index = SearchIndex(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def search(self, q, limit=20, cursor=0):
+        return self.search_index.search(q, limit=limit, cursor=cursor)
+
+class CatalogCache:
+    """
+    Keeps the media catalog on disk and in memory, revalidating it against the CDN
+    with ETag/If-Modified-Since once the TTL has expired, and at most every retry_after
+    seconds while the CDN is failing.
+    The disk copy is shared by every worker process on the host.
+    """
+    def __init__(self, url=CATALOG_URL, cache_dir=None, ttl=3600, timeout=60, retry_after=300):
+        self.url = url
+        self.cache_dir = Path(cache_dir or os.path.join(tempfile.gettempdir(), 'jwmediaconverter'))
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_after = retry_after
+        name = os.path.basename(url) or 'catalog.json.gz'
+        self.data_path = self.cache_dir / name
+        self.meta_path = self.cache_dir / f"{name}.meta.json"
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._index = None
+        self._loaded_version = None
+        self._meta = {}
+        self._meta_mtime = None
+
+    def get_index(self):
+        """
+        Return the current CatalogIndex. Once one is loaded it is served as is while a
+        background thread revalidates it with the CDN, so searches never wait on a refresh.
+        """
+        with self._lock:
+            if self._index is not None:
+                if not self._refreshing and self._needs_refresh():
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, name="catalog-refresh", daemon=True).start()
+                return self._index
+        # Nothing to serve yet: the first caller loads the catalog, concurrent ones wait for it
+        with self._load_lock:
+            if self._index is None:
+                self.refresh()
+            return self._index
+
+    def refresh(self):
+        """Revalidate the catalog if the TTL has expired, and rebuild the index if it changed."""
+        meta = self._read_meta()
+        if self._is_stale(meta):
+            try:
+                with metrics.span('catalog_download'):
+                    meta = self._revalidate(meta)
+            except Exception as e:
+                # Serve the last good copy rather than failing the request, and leave the CDN
+                # alone for retry_after seconds; the meta file tells the other workers too
+                if not self.data_path.exists():
+                    raise
+                print(f"Catalog revalidation failed, serving cached copy: {e}")
+                meta['retry_at'] = time.time() + self.retry_after
+                self._write_meta(meta)
+        version = meta.get('version')
+        if self._index is None or version != self._loaded_version:
+            with metrics.span('catalog_index'):
+                index = CatalogIndex(parse_catalog_file(self.data_path))
+            with self._lock:
+                self._index = index
+                self._loaded_version = version
+            print(f"Catalog index built with {len(index)} videos.")
+        return self._index
+
+    def _needs_refresh(self):
+        # Another worker may have downloaded a newer catalog into the shared cache.
+        # Runs on every search, so the meta file is only parsed again when it has changed
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except OSError:
+            return True
+        if mtime != self._meta_mtime:
+            self._meta = self._read_meta()
+            self._meta_mtime = mtime
+        return self._is_stale(self._meta) or self._meta.get('version') != self._loaded_version
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"Catalog refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _is_stale(self, meta):
+        if not meta or not self.data_path.exists():
+            return True
+        now = time.time()
+        if meta.get('retry_at', 0) > now:
+            return False
+        return now - meta.get('checked_at', 0) >= self.ttl
+
+    def _revalidate(self, meta):
+        headers = {}
+        if self.data_path.exists():
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+        response = http_client.get(self.url, headers=headers, stream=True, timeout=self.timeout)
+        try:
+            if response.status_code == 304:
+                meta['checked_at'] = time.time()
+                self._write_meta(meta)
+                return meta
+            if response.status_code != 200:
+                raise Exception(f"Failed to download gz file from {self.url}")
+
+            # Write to a temp file next to the cache and swap it in atomically
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=1024 * 1024):
+                        if chunk:
+                            f.write(chunk)
+                os.replace(tmp_path, self.data_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        finally:
+            response.close()
+
+        meta = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked_at': time.time(),
+            'version': response.headers.get('ETag') or response.headers.get('Last-Modified') or str(time.time()),
+        }
+        self._write_meta(meta)
+        return meta
+
+    def _read_meta(self):
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_meta(self, meta):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.meta.part')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
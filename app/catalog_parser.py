@@ -0,0 +1,101 @@
+import json
+import zlib
+import http_client
+
+CHUNK_SIZE = 64 * 1024
+
+class CatalogItem:
+    """
+    Compact record for a VIDEO media item; only the fields the app uses are kept.
+    """
+    __slots__ = ('title', 'key', 'natural_key', 'duration', 'first_published')
+
+    # Catalog JSON field -> attribute
+    FIELDS = {
+        'title': 'title',
+        'languageAgnosticNaturalKey': 'key',
+        'naturalKey': 'natural_key',
+        'duration': 'duration',
+        'firstPublished': 'first_published',
+    }
+
+    def __init__(self, title, key=None, natural_key=None, duration=None, first_published=None):
+        self.title = title
+        self.key = key
+        self.natural_key = natural_key
+        self.duration = duration
+        self.first_published = first_published
+
+    @classmethod
+    def from_json(cls, o):
+        return cls(o['title'], o.get('languageAgnosticNaturalKey'), o.get('naturalKey'),
+                   o.get('duration'), o.get('firstPublished'))
+
+    def to_dict(self):
+        """Return the item using the catalog's own field names, skipping missing values."""
+        d = {}
+        for field, attr in self.FIELDS.items():
+            value = getattr(self, attr)
+            if value is not None:
+                d[field] = value
+        return d
+
+def iter_lines(chunks):
+    """
+    Incrementally gunzip an iterable of compressed chunks and yield complete lines.
+    Decompressed output is produced at most CHUNK_SIZE bytes at a time, so memory stays
+    bounded however well the catalog compresses. Handles multi-member gzip streams.
+    """
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    pending = b''
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk, CHUNK_SIZE)
+            if decompressor.eof:
+                # Start of another gzip member
+                chunk = decompressor.unused_data
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            else:
+                chunk = decompressor.unconsumed_tail
+            if not data:
+                continue
+            lines = (pending + data).split(b'\n')
+            pending = lines.pop()
+            yield from lines
+    pending += decompressor.flush()
+    yield from pending.split(b'\n')
+
+def iter_video_items(chunks):
+    """
+    Yield a CatalogItem for every VIDEO media item in a gzipped JSON-lines catalog.
+    Lines are pre-filtered on raw bytes so most of the catalog is never JSON-decoded.
+    """
+    for line in iter_lines(chunks):
+        if b'media-item' not in line or b'"VIDEO"' not in line:
+            continue
+        try:
+            json_obj = json.loads(line)
+        except ValueError:
+            continue
+        o = json_obj.get('o', {})
+        if json_obj.get('type') == 'media-item' and o.get('keyParts', {}).get('formatCode') == 'VIDEO' and 'title' in o:
+            yield CatalogItem.from_json(o)
+
+def iter_file_chunks(fileobj, chunk_size=CHUNK_SIZE):
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+def parse_catalog_file(path):
+    """Parse a gzipped catalog from disk into a list of CatalogItem."""
+    with open(path, 'rb') as f:
+        return list(iter_video_items(iter_file_chunks(f)))
+
+def stream_catalog(gz_url, timeout=60):
+    """Download and parse a gzipped catalog, decompressing as bytes arrive from the socket."""
+    with http_client.get(gz_url, stream=True, timeout=timeout) as response:
+        if response.status_code != 200:
+            raise Exception(f"Failed to download gz file from {gz_url}")
+        yield from iter_video_items(response.iter_content(chunk_size=CHUNK_SIZE))
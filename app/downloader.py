@@ -0,0 +1,62 @@
+import os
+import time
+import requests
+import http_client
+
+CHUNK_SIZE = 1024 * 1024
+
+def _preallocate(f, size):
+    """Reserve size bytes for f up front, so the filesystem can lay the file out contiguously."""
+    try:
+        os.posix_fallocate(f.fileno(), 0, size)
+    except (AttributeError, OSError):
+        pass
+
+def download_to_path(url, path, expected_size=None, chunk_size=CHUNK_SIZE, preallocate=True, max_resumes=3):
+    """
+    Stream url straight into the file at path, one chunk at a time, so memory use is
+    constant whatever the size of the download.
+
+    If the connection drops part way, the download resumes from the last byte written
+    using an HTTP Range request (up to max_resumes times). When expected_size is given
+    the file is preallocated and its final size is checked.
+    Returns the number of bytes written.
+    """
+    written = 0
+    resumes = 0
+    with open(path, 'wb', buffering=chunk_size) as f:
+        if preallocate and expected_size:
+            _preallocate(f, expected_size)
+
+        while True:
+            headers = {'Range': f'bytes={written}-'} if written else {}
+            try:
+                with http_client.get(url, headers=headers, stream=True) as response:
+                    if response.status_code == 416 and written and written == expected_size:
+                        # Nothing left to fetch
+                        break
+                    if response.status_code not in (200, 206):
+                        raise Exception(f"Failed to download file from {url}")
+                    if written and response.status_code == 200:
+                        # The server ignored the Range header; start over
+                        f.seek(0)
+                        written = 0
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if chunk:
+                            f.write(chunk)
+                            written += len(chunk)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                resumes += 1
+                if resumes > max_resumes:
+                    raise Exception(f"Failed to download file from {url}: {e}")
+                print(f"Download of {url} interrupted at {written} bytes, resuming: {e}")
+                f.flush()
+                time.sleep(min(2 ** resumes, 10))
+
+        # Drop any preallocated space past the end of the data
+        f.truncate(written)
+
+    if expected_size and written != expected_size:
+        raise Exception(f"Incomplete download from {url}: got {written} of {expected_size} bytes")
+    return written
@@ -0,0 +1,83 @@
+import subprocess
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+# Let ffmpeg resume an HTTP input after a dropped connection instead of failing the mux
+HTTP_INPUT_OPTIONS = ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '10']
+
+def _is_url(source):
+    return source.startswith(('http://', 'https://'))
+
+def build_command(audio, subtitles=(), output='pipe:1'):
+    """
+    Build the ffmpeg command muxing the video of the first audio source, every audio track
+    and the subtitle files into Matroska. audio and subtitles are lists of
+    (source, language, title) tuples; sources may be local paths or HTTP URLs.
+    """
+    command = ['ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y']
+    for source, _, _ in list(audio) + list(subtitles):
+        if _is_url(source):
+            command.extend(HTTP_INPUT_OPTIONS)
+        command.extend(['-i', source])
+
+    # Only the tracks that end up in the MKV: the first input's video and each input's first audio
+    command.extend(['-map', '0:v:0'])
+    for index in range(len(audio)):
+        command.extend(['-map', f'{index}:a:0'])
+    for index in range(len(subtitles)):
+        command.extend(['-map', f'{len(audio) + index}:s:0'])
+    command.extend(['-map_metadata', '0', '-c:v', 'copy', '-c:a', 'copy', '-c:s', 'srt'])
+
+    for kind, tracks in (('a', audio), ('s', subtitles)):
+        for index, (_, language, title) in enumerate(tracks):
+            command.extend([f'-metadata:s:{kind}:{index}', f'language={language}',
+                            f'-metadata:s:{kind}:{index}', f'title={title}'])
+
+    command.extend(['-f', 'matroska', output])
+    return command
+
+def run(command, write=None):
+    """
+    Run an ffmpeg command. If write is given, the output on stdout is passed to it in
+    chunks as ffmpeg produces it, so it is never held in memory as a whole.
+    stderr is drained on its own thread so a chatty ffmpeg can't block on a full pipe.
+    """
+    process = subprocess.Popen(command, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE if write else subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = []
+    drain = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    drain.start()
+    try:
+        if write:
+            for chunk in iter(lambda: process.stdout.read(CHUNK_SIZE), b''):
+                write(chunk)
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        if write:
+            process.stdout.close()
+        process.wait()
+        drain.join()
+        process.stderr.close()
+
+    if process.returncode != 0:
+        error = b''.join(stderr).decode('utf-8', errors='replace').strip()
+        raise Exception(f"FFmpeg exited with code {process.returncode}: {error[-2000:]}")
+
+def stream_mux(audio, subtitles=(), output=None):
+    """
+    Mux straight from the sources, which may be HTTP URLs: ffmpeg reads them as it
+    muxes, so the videos are never written to disk first and muxing starts immediately.
+    See build_command for audio and subtitles.
+
+    output is either a path, which ffmpeg writes itself so the MKV gets its seek index,
+    or a writable file object, which receives the Matroska stream from stdout as it is
+    produced.
+    """
+    if isinstance(output, str):
+        run(build_command(audio, subtitles, output))
+    else:
+        run(build_command(audio, subtitles), output.write)
+    return output
@@ -0,0 +1,86 @@
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '16'))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '32'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.5'))
+# Thread pools for gather(): 'transfers' for file downloads, 'lookups' for small metadata requests,
+# so lookups never wait behind whole video downloads
+HTTP_CONCURRENCY = int(os.getenv('HTTP_CONCURRENCY', '16'))
+HTTP_LOOKUP_CONCURRENCY = int(os.getenv('HTTP_LOOKUP_CONCURRENCY', '16'))
+POOL_SIZES = {'transfers': HTTP_CONCURRENCY, 'lookups': HTTP_LOOKUP_CONCURRENCY}
+
+_session = None
+_executors = {}
+_lock = threading.Lock()
+
+def _new_session():
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def get_session():
+    """
+    Return the process-wide requests.Session.
+    Connections to the CDN and mediator hosts are kept alive and reused across requests,
+    and idempotent requests are retried with exponential backoff.
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _new_session()
+    return _session
+
+def _get_executor(pool):
+    executor = _executors.get(pool)
+    if executor is None:
+        with _lock:
+            executor = _executors.get(pool)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=POOL_SIZES[pool], thread_name_prefix=f'http-{pool}')
+                _executors[pool] = executor
+    return executor
+
+def get(url, **kwargs):
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    return get_session().get(url, **kwargs)
+
+def submit(fn, *args, pool='transfers'):
+    """Run fn(*args) on the named HTTP thread pool ('transfers' or 'lookups') and return its future."""
+    return _get_executor(pool).submit(fn, *args)
+
+def gather(*calls, pool='transfers'):
+    """
+    Run (fn, *args) calls concurrently on the named HTTP thread pool and return their
+    results in order. The first exception raised by any call is re-raised.
+    """
+    futures = [submit(fn, *args, pool=pool) for fn, *args in calls]
+    return [future.result() for future in futures]
+
+def _reset_after_fork():
+    # Sockets and threads don't survive fork(); children build their own lazily
+    global _session, _executors, _lock
+    _session = None
+    _executors = {}
+    _lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
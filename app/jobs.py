@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import traceback
+from contextlib import contextmanager
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    stage TEXT,
+    payload TEXT NOT NULL,
+    videos TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat REAL,
+    cost INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+class QueueFull(Exception):
+    """The queue is at its limit; the client should retry after retry_after seconds."""
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class JobTooLarge(Exception):
+    """The job alone needs more than the byte budget, so it could never run."""
+    pass
+
+class JobQueue:
+    """
+    SQLite-backed job queue shared by every worker process on the host.
+
+    Jobs survive worker restarts: a running job whose heartbeat goes stale is put back
+    in the queue (up to max_attempts). At most `concurrency` jobs run at once across
+    all processes sharing the database. Finished jobs are deleted `retention` seconds
+    after they end (0 keeps them).
+
+    Each job carries a cost, the bytes it is expected to hold on disk and in memory
+    while it runs. Jobs start in order, and the oldest waits rather than being overtaken
+    while the running jobs' costs plus its own would exceed max_bytes, so bursts queue
+    up instead of running the host out of space. enqueue() rejects jobs with QueueFull
+    once max_queued jobs are waiting, and with JobTooLarge if a job's cost alone is
+    over max_bytes (0 means no limit for either).
+
+    handler(job_id, payload, report) does the work and returns the job result;
+    report(index, stage, progress=None) records per-video progress, or the job
+    stage when index is None.
+    """
+    def __init__(self, db_path, handler, concurrency=2, poll_interval=1.0, stale_after=120, max_attempts=3,
+                 max_bytes=0, max_queued=0, retry_after=30, retention=7 * 24 * 3600):
+        self.db_path = db_path
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_bytes = max_bytes
+        self.max_queued = max_queued
+        self.retry_after = retry_after
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._active = set()
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._started = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def start(self):
+        """Start the worker and heartbeat threads for this process."""
+        if self._started:
+            return
+        self._started = True
+        for i in range(self.concurrency):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True).start()
+
+    def enqueue(self, payload, titles, cost=0):
+        """
+        Queue a job and return its id. titles names each video, for progress reporting;
+        cost is the job's estimated footprint in bytes. Raises QueueFull or JobTooLarge.
+        """
+        if self.max_bytes and cost > self.max_bytes:
+            raise JobTooLarge(f"The job needs about {cost / 1e9:.1f} GB, more than the "
+                              f"{self.max_bytes / 1e9:.1f} GB available; select fewer videos or languages")
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        videos = [{"title": title, "stage": QUEUED, "progress": 0.0} for title in titles]
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_queued(conn)
+                conn.execute(
+                    "INSERT INTO jobs (id, status, stage, payload, videos, created_at, updated_at, cost) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, QUEUED, QUEUED, json.dumps(payload), json.dumps(videos), now, now, cost))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self._wakeup.set()
+        return job_id
+
+    def check_capacity(self):
+        """
+        Raise QueueFull if max_queued jobs are already waiting. A cheap check to run before
+        the work of preparing a job; enqueue() checks again atomically.
+        """
+        with self._connect() as conn:
+            self._check_queued(conn)
+
+    def _check_queued(self, conn):
+        if not self.max_queued:
+            return
+        queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        if queued >= self.max_queued:
+            raise QueueFull(f"{queued} jobs are already waiting", self.retry_after)
+
+    def stats(self):
+        """Return the number and total cost of queued and running jobs."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*), COALESCE(SUM(cost), 0) FROM jobs "
+                                "WHERE status IN (?, ?) GROUP BY status", (QUEUED, RUNNING)).fetchall()
+        stats = {"queued": 0, "queued_bytes": 0, "running": 0, "running_bytes": 0}
+        for status, count, cost in rows:
+            stats[status] = count
+            stats[f"{status}_bytes"] = cost
+        return stats
+
+    def get(self, job_id):
+        """Return the public state of a job, or None if it doesn't exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "id": row['id'],
+            "status": row['status'],
+            "stage": row['stage'],
+            "videos": json.loads(row['videos']),
+            "result": row['result'],
+            "error": row['error'],
+            "created_at": row['created_at'],
+            "updated_at": row['updated_at'],
+        }
+        if row['status'] == QUEUED:
+            with self._connect() as conn:
+                job['position'] = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?",
+                    (QUEUED, row['created_at'])).fetchone()[0]
+        return job
+
+    def report(self, job_id, index, stage, progress=None):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT videos FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                now = time.time()
+                if row is None:
+                    # Purged, or removed from the database by hand, while it ran
+                    pass
+                elif index is None:
+                    conn.execute("UPDATE jobs SET stage = ?, updated_at = ?, heartbeat = ? WHERE id = ?",
+                                 (stage, now, now, job_id))
+                else:
+                    videos = json.loads(row['videos'])
+                    videos[index]['stage'] = stage
+                    if progress is not None:
+                        videos[index]['progress'] = round(progress, 3)
+                    conn.execute("UPDATE jobs SET videos = ?, updated_at = ?, heartbeat = ? WHERE id = ?",
+                                 (json.dumps(videos), now, now, job_id))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running, respecting the concurrency and byte caps."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Requeue jobs orphaned by a worker that died mid-run
+                conn.execute(
+                    "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                    "error = CASE WHEN attempts >= ? THEN 'Worker stopped responding' ELSE error END, updated_at = ? "
+                    "WHERE status = ? AND heartbeat < ?",
+                    (self.max_attempts, FAILED, QUEUED, self.max_attempts, now, RUNNING, now - self.stale_after))
+
+                running, running_cost = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(cost), 0) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()
+                row = None
+                if running < self.concurrency:
+                    row = conn.execute(
+                        "SELECT id, payload, cost FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                        (QUEUED,)).fetchone()
+                # A job always runs when nothing else is, even if the budget was lowered after it was queued
+                if row is not None and self.max_bytes and running and running_cost + row['cost'] > self.max_bytes:
+                    row = None
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, heartbeat = ? WHERE id = ?",
+                        (RUNNING, now, now, row['id']))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return row['id'], json.loads(row['payload'])
+
+    def _finish(self, job_id, status, result=None, error=None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = ?, stage = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                         (status, status, result, error, now, job_id))
+
+    def _worker(self):
+        while True:
+            try:
+                claimed = self._claim()
+            except sqlite3.Error as e:
+                print(f"Job queue error: {e}")
+                claimed = None
+            if claimed is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, payload = claimed
+            with self._active_lock:
+                self._active.add(job_id)
+            try:
+                report = lambda index, stage, progress=None: self.report(job_id, index, stage, progress)
+                result = self.handler(job_id, payload, report)
+                self._finish(job_id, DONE, result=result)
+            except Exception as e:
+                traceback.print_exc()
+                self._finish(job_id, FAILED, error=str(e))
+            finally:
+                with self._active_lock:
+                    self._active.discard(job_id)
+            # Another job may be waiting on the slot we just freed
+            self._wakeup.set()
+
+    def purge(self):
+        """Delete jobs that finished more than retention seconds ago; returns how many."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                                (DONE, FAILED, time.time() - self.retention)).rowcount
+
+    def _heartbeat(self):
+        interval = max(self.stale_after / 4, 1)
+        last_purge = 0
+        while True:
+            time.sleep(interval)
+            if self.retention and time.monotonic() - last_purge >= 600:
+                last_purge = time.monotonic()
+                try:
+                    self.purge()
+                except sqlite3.Error as e:
+                    print(f"Job purge error: {e}")
+            with self._active_lock:
+                active = list(self._active)
+            if not active:
+                continue
+            try:
+                with self._connect() as conn:
+                    conn.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?", [(time.time(), j) for j in active])
+            except sqlite3.Error as e:
+                print(f"Job heartbeat error: {e}")
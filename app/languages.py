@@ -0,0 +1,39 @@
+from collections import namedtuple
+
+# code: JW language code used by the mediator and CDN; iso: ISO 639-2 code for the MKV tracks;
+# name: subtitle track title; pinyin: whether a pinyin subtitle track is generated as well
+Language = namedtuple('Language', ['code', 'iso', 'name', 'pinyin'])
+
+LANGUAGES = {language.code: language for language in [
+    Language('E', 'eng', "English", False),
+    Language('CHS', 'chi', "中文", True),
+    Language('CH', 'chi', "中文（繁體）", False),
+    Language('J', 'jpn', "日本語", False),
+    Language('KO', 'kor', "한국어", False),
+    Language('S', 'spa', "Español", False),
+    Language('F', 'fre', "Français", False),
+    Language('X', 'ger', "Deutsch", False),
+    Language('I', 'ita', "Italiano", False),
+    Language('O', 'dut', "Nederlands", False),
+    Language('T', 'por', "Português", False),
+    Language('U', 'rus', "Русский", False),
+]}
+
+MAX_LANGUAGES = 8
+
+def parse_languages(value):
+    """
+    Parse a comma-separated language set such as "E,CHS,J,KO" into a list of codes.
+    The first language supplies the video. Raises ValueError for unknown or repeated codes.
+    """
+    codes = [code.strip().upper() for code in value.split(',') if code.strip()]
+    if not codes:
+        raise ValueError("No languages given")
+    if len(codes) > MAX_LANGUAGES:
+        raise ValueError(f"At most {MAX_LANGUAGES} languages are supported")
+    unknown = [code for code in codes if code not in LANGUAGES]
+    if unknown:
+        raise ValueError(f"Unsupported languages: {', '.join(unknown)}")
+    if len(set(codes)) != len(codes):
+        raise ValueError("Languages must not repeat")
+    return codes
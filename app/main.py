@@ -1,8 +1,10 @@
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
 import os
 import zipfile
-import requests
 import gzip
-import io
 import json
 import subprocess
 import shutil
@@ -10,15 +12,27 @@ import tempfile
 import uuid
 import re
 import subprocess as sp
-from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for, flash, send_file
+from flask import Flask, jsonify, render_template, request, send_from_directory, redirect, url_for, flash, send_file, g, Response
 from flask_bootstrap import Bootstrap5
 from flask_wtf import FlaskForm
 from wtforms import StringField
 from wtforms.validators import DataRequired
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from subtitle_processor import SubtitleProcessor
-from pymkv import MKVFile, MKVTrack
-from io import BytesIO
+from catalog_cache import CatalogCache, CATALOG_URL
+from jobs import JobQueue, QueueFull, JobTooLarge
+from pipeline import ConversionPipeline
+import http_client
+from downloader import download_to_path
+from media_cache import FileCache, cache_key
+from archive import iter_zip
+from blob_upload import BlockUploader
+from workspace import WorkspaceManager
+from vtt import parse_vtt, format_srt
+from ffmpeg_mux import stream_mux
+from languages import LANGUAGES, parse_languages
+from mediator import MediatorClient
+import warmup
+import metrics
+import threading
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -40,9 +54,95 @@ else:
 
 # Azure Blob Storage setup (replace with your credentials)
 AZURE_CONNECTION_STRING  = os.getenv('BLOB_CONNECTION_STRING')
-AZURE_CONTAINER_NAME  = "convertedfiles"
-blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
+# Set BLOB_CONNECTION_STRING=UseDevelopmentStorage=true to upload to a local Azurite emulator
+AZURE_CONTAINER_NAME  = os.getenv('BLOB_CONTAINER_NAME', "convertedfiles")
+
+# Block upload tuning: blocks are staged in parallel while the ZIP is still being produced
+UPLOAD_BLOCK_SIZE = int(os.getenv('UPLOAD_BLOCK_SIZE', str(8 * 1024 * 1024)))
+UPLOAD_CONCURRENCY = int(os.getenv('UPLOAD_CONCURRENCY', '4'))
+block_uploader = BlockUploader(block_size=UPLOAD_BLOCK_SIZE, concurrency=UPLOAD_CONCURRENCY)
+
+# Media catalog cache, shared on disk by all workers and revalidated once the TTL expires
+CATALOG_CACHE_DIR = os.getenv('CATALOG_CACHE_DIR')
+CATALOG_TTL = int(os.getenv('CATALOG_TTL', '3600'))
+catalog_cache = CatalogCache(CATALOG_URL, cache_dir=CATALOG_CACHE_DIR, ttl=CATALOG_TTL)
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# Background conversion jobs, persisted in SQLite so they survive worker restarts;
+# finished jobs are deleted JOB_RETENTION seconds after they end
+JOBS_DB = os.getenv('JOBS_DB', os.path.join(tempfile.gettempdir(), 'jwmediaconverter', 'jobs.sqlite3'))
+JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '2'))
+JOB_RETENTION = int(os.getenv('JOB_RETENTION', str(7 * 24 * 3600)))
+
+# Per-stage parallelism of the conversion pipeline, shared by all jobs in this process
+FETCH_WORKERS = int(os.getenv('FETCH_WORKERS', '8'))
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', '2'))
+MUX_WORKERS = int(os.getenv('MUX_WORKERS', '2'))
+pipeline = ConversionPipeline(fetch_workers=FETCH_WORKERS, cpu_workers=CPU_WORKERS, mux_workers=MUX_WORKERS)
+
+# How MKVs are built: 'mkvmerge' downloads the videos first, 'stream' has ffmpeg read them
+# from their URLs while muxing, so only the subtitles touch the disk
+MUX_MODE = os.getenv('MUX_MODE', 'mkvmerge')
+if MUX_MODE not in ('mkvmerge', 'stream'):
+    raise Exception(f"Unknown MUX_MODE {MUX_MODE!r}, expected 'mkvmerge' or 'stream'")
+
+# Languages combined into each MKV unless the request picks its own; the first supplies the video
+DEFAULT_LANGUAGES = parse_languages(os.getenv('DEFAULT_LANGUAGES', 'E,CHS'))
+
+# Mediator lookups are cached briefly, so a job fetches every video x language in one concurrent round
+MEDIATOR_CACHE_TTL = int(os.getenv('MEDIATOR_CACHE_TTL', '300'))
+mediator = MediatorClient(ttl=MEDIATOR_CACHE_TTL)
+
+# Rendition downloaded for the other languages' videos, of which only the audio track is used:
+# 'smallest' (lower resolutions mostly drop video bytes) or 'largest'
+SECONDARY_RENDITION = os.getenv('SECONDARY_RENDITION', 'smallest')
+if SECONDARY_RENDITION not in ('smallest', 'largest'):
+    raise Exception(f"Unknown SECONDARY_RENDITION {SECONDARY_RENDITION!r}, expected 'smallest' or 'largest'")
+
+# Per-job scratch directories; point SCRATCH_DIR at tmpfs or another fast volume.
+# WORKSPACE_QUOTA_BYTES caps one job, SCRATCH_MAX_BYTES all jobs on the host (0 = no limit)
+SCRATCH_DIR = os.getenv('SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'jwmediaconverter', 'scratch'))
+WORKSPACE_QUOTA_BYTES = int(os.getenv('WORKSPACE_QUOTA_BYTES', '0'))
+SCRATCH_MAX_BYTES = int(os.getenv('SCRATCH_MAX_BYTES', '0'))
+SCRATCH_OVERHEAD_BYTES = 16 * 1024 * 1024  # subtitles and mkvmerge working files
+workspaces = WorkspaceManager(SCRATCH_DIR, quota_bytes=WORKSPACE_QUOTA_BYTES, total_bytes=SCRATCH_MAX_BYTES)
+
+# Local cache of downloaded MP4/VTT files, shared by all workers; MEDIA_CACHE_MAX_BYTES=0 disables it
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'jwmediaconverter', 'media'))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+media_cache = FileCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+
+# Cache of finished MKVs keyed on their inputs; bump RESULT_FORMAT_VERSION when the track layout changes
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'jwmediaconverter', 'results'))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))
+RESULT_FORMAT_VERSION = 2
+result_cache = FileCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+
+# Admission control: jobs only start while the estimated bytes of all running jobs fit in JOB_MAX_BYTES,
+# by default SCRATCH_MAX_BYTES or else scratch_budget(). /download answers 413 for jobs whose known
+# sizes alone exceed it, and 429 with Retry-After once JOB_MAX_QUEUED jobs are waiting (0 = no limit
+# for either). Sizes are looked up for at most JOB_ESTIMATE_TIMEOUT seconds; videos not known by then
+# count JOB_UNKNOWN_VIDEO_BYTES, and if that would exceed the budget the request gets a 503 with
+# Retry-After, by which time the lookups have usually finished
+def scratch_budget():
+    """
+    80% of the space free on the scratch volume, less what the media and result caches may
+    still grow into if they share that volume.
+    """
+    free = shutil.disk_usage(SCRATCH_DIR).free
+    device = os.stat(SCRATCH_DIR).st_dev
+    for cache in (media_cache, result_cache):
+        if cache.enabled and os.stat(cache.cache_dir).st_dev == device:
+            free -= max(0, cache.max_bytes - cache.stats()['bytes'])
+    return max(0, int(free * 0.8))
+
+JOB_MAX_BYTES = int(os.getenv('JOB_MAX_BYTES') or SCRATCH_MAX_BYTES or scratch_budget())
+JOB_MAX_QUEUED = int(os.getenv('JOB_MAX_QUEUED', '20'))
+JOB_RETRY_AFTER = int(os.getenv('JOB_RETRY_AFTER', '30'))
+JOB_ESTIMATE_TIMEOUT = float(os.getenv('JOB_ESTIMATE_TIMEOUT', '3'))
+JOB_UNKNOWN_VIDEO_BYTES = int(os.getenv('JOB_UNKNOWN_VIDEO_BYTES', str(1024 ** 3)))
+JOB_MEMORY_BYTES = (UPLOAD_CONCURRENCY + 1) * UPLOAD_BLOCK_SIZE  # upload blocks in flight
 
 class NameForm(FlaskForm):
     name = StringField('Title', validators=[DataRequired()])
@@ -53,7 +153,8 @@ def index():
     if form.validate_on_submit():
         name = form.name.data
         return redirect(url_for('hello', name=name))
-    return render_template('index.html', form=form)
+    return render_template('index.html', form=form, default_languages=','.join(DEFAULT_LANGUAGES),
+                           languages=LANGUAGES.values())
 
 @app.route('/favicon.ico')
 def favicon():
@@ -68,53 +169,189 @@ def hello():
     else:
         return redirect(url_for('index'))
     
+# /search?q=hope&limit=20&cursor=40
 @app.route('/search')
 def search_titles():
-    gz_url = 'https://app.jw-cdn.org/catalogs/media/E.json.gz'
+    q = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', SEARCH_DEFAULT_LIMIT)), SEARCH_MAX_LIMIT)
+        cursor = int(request.args.get('cursor', 0))
+        if limit < 1 or cursor < 0:
+            raise ValueError
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer and cursor a non-negative integer"}), 400
 
     try:
-        json_data = fetch_and_decompress_gz(gz_url)
-        videos = [{"title": o['title'], "data": o} for o in json_data if 'title' in o]  # Extract full object but show title
-        return jsonify(videos)
+        # Served from the cached index; the catalog is only re-downloaded when it changes
+        index = catalog_cache.get_index()
+        return jsonify(index.search(q, limit=limit, cursor=cursor))
     except Exception as e:
         print(f"An error occurred: {e}")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/download', methods=['POST'])
 def download_selected_videos():
-    print(request)
-      # Get the selected videos from the form data
+    # Get the selected videos from the form data
     selected_videos_json = request.form.get('selected_videos', '[]')
-    selected_videos = json.loads(selected_videos_json)
-    
-    combined_streams = []
+    try:
+        selected_videos = json.loads(selected_videos_json)
+        titles = [video['data']['title'] for video in selected_videos]
+        keys = [video['data']['languageAgnosticNaturalKey'] for video in selected_videos]
+        if not all(isinstance(key, str) and key for key in keys):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return jsonify({"status": "error", "message": "Invalid selected_videos"}), 400
+    if not selected_videos:
+        return jsonify({"status": "error", "message": "No videos selected"}), 400
+    try:
+        languages = parse_languages(request.form.get('languages') or ','.join(DEFAULT_LANGUAGES))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
 
-    # Fetch, combine, and zip videos
-    for video in selected_videos:
-        try:
-            language_agnostic_natural_key = video['data']['languageAgnosticNaturalKey']
-            video_info = fetch_download_links(language_agnostic_natural_key)
-
-            # Convert and combine video, audio, and subtitles
-            #combined_stream = process_convert(video_info)
-            combined_stream = combine_streams(video_info)
-            if combined_stream:
-                combined_streams.append({f"{video['data']['title']}.mkv": combined_stream})
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)}), 500
-
-    # Zip the combined streams
-    zip_stream = create_zip(combined_streams)
-
-    # Upload ZIP to Azure Blob Storage
-    zip_blob_name = f"{str(uuid.uuid4())}.zip"
+    # The conversion runs in the background; the job page polls /jobs/<id> until it is done.
+    # A full queue is turned away before the job's size is looked up, so rejections stay cheap
     try:
-        zip_blob_url = upload_to_azure(zip_blob_name, zip_stream)
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        job_queue.check_capacity()
+        known, unknown = job_estimate(keys, languages)
+        cost = known + unknown * JOB_UNKNOWN_VIDEO_BYTES
+        if unknown and JOB_MAX_BYTES and known <= JOB_MAX_BYTES < cost:
+            # Only the sizes that aren't known yet make the job too large; they will be soon
+            metrics.REGISTRY.inc('jwmc_admissions_total', result='estimate_pending')
+            response = jsonify({"status": "error", "retry_after": JOB_RETRY_AFTER,
+                                "message": f"The sizes of {unknown} videos are still being looked up; try again shortly"})
+            response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+            return response, 503
+        # Raises JobTooLarge only when the known sizes alone exceed JOB_MAX_BYTES
+        job_id = job_queue.enqueue({"videos": selected_videos, "languages": languages}, titles, cost=cost)
+    except QueueFull as e:
+        metrics.REGISTRY.inc('jwmc_admissions_total', result='queue_full')
+        response = jsonify({"status": "error", "message": f"The converter is busy ({e}); try again shortly",
+                            "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    except JobTooLarge as e:
+        metrics.REGISTRY.inc('jwmc_admissions_total', result='too_large')
+        return jsonify({"status": "error", "message": str(e)}), 413
+    metrics.REGISTRY.inc('jwmc_admissions_total', result='accepted')
+    return redirect(url_for('job_page', job_id=job_id))
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify({"media": media_cache.stats(), "results": result_cache.stats()})
+
+# Prometheus scrape endpoint; every gunicorn worker reports its own numbers
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# Function to render a progress page that polls the job status
+@app.route('/job_page')
+def job_page():
+    job_id = request.args.get('job_id')
+    if job_id:
+        return render_template('job.html', job_id=job_id)
+    else:
+        return "No job id found.", 400
 
-    # Redirect to download page
-    return redirect(url_for('download_page', download_url=zip_blob_url))
+def process_job(job_id, payload, report):
+    """
+    Run a queued conversion job: fetch, combine, zip and upload every selected video.
+    Videos move through the shared pipeline concurrently; the ZIP keeps the selection order.
+    Returns the URL of the uploaded ZIP.
+    """
+    videos = payload['videos']
+    languages = payload.get('languages') or DEFAULT_LANGUAGES
+    keys = [video['data']['languageAgnosticNaturalKey'] for video in videos]
+    workspace = workspaces.create('job')
+    workdirs = [workspace.subdir(f"video{index}") for index in range(len(videos))]
+    # Stage timings, bytes and cache lookups, logged as one line when the job ends
+    trace = metrics.JobTrace(job_id)
+
+    def fetch(index):
+        report(index, 'fetching', 0.0)
+        video_info = fetch_download_links(keys[index], languages)
+        if result_cache.enabled:
+            cached = result_cache.contains(result_key(video_info))
+            trace.cache_lookup('results', cached)
+            if cached:
+                # Already converted recently; skip the downloads
+                report(index, 'cached', 0.5)
+                return index, video_info, None
+        workspace.reserve(scratch_estimate(video_info))
+        files = fetch_inputs(workdirs[index], video_info, trace, index)
+        # Files the mediator gave no size for weren't covered by the reservation
+        workspace.true_up()
+        return index, video_info, files
+
+    def subtitles(state):
+        index, video_info, files = state
+        if files is None:
+            return state
+        report(index, 'subtitles', 0.5)
+        return index, video_info, prepare_subtitles(files, trace, index)
+
+    def mux(state):
+        index, video_info, files = state
+        report(index, 'muxing', 0.7)
+
+        def build(path):
+            prepared = files
+            if prepared is None:
+                # The cached result was evicted after the fetch stage saw it
+                prepared = prepare_subtitles(fetch_inputs(workdirs[index], video_info, trace, index), trace, index)
+            with trace.span('mux', index) as span:
+                mux_video(video_info, prepared, path)
+                span.bytes = os.path.getsize(path)
+
+        output_path = os.path.join(workdirs[index], "output.mkv")
+        if result_cache.enabled:
+            # Identical conversions running at the same time wait for a single mux
+            result_cache.fetch_to(result_key(video_info), output_path, build)
+        else:
+            build(output_path)
+        workspace.true_up()
+        report(index, 'done', 1.0)
+        return output_path
+
+    report(None, 'converting')
+    status = 'failed'
+    try:
+        # Look up every video in every language at once; the fetch stage then reads the cache
+        with trace.span('mediator'):
+            mediator.media_items(keys, languages)
+        outcomes = pipeline.map(range(len(videos)), fetch, subtitles, mux)
+
+        combined_files = []
+        for index, (output_path, error) in enumerate(outcomes):
+            if error is not None:
+                print(f"Error during conversion: {error}")
+                report(index, 'failed', 1.0)
+            else:
+                combined_files.append({f"{videos[index]['data']['title']}.mkv": output_path})
+
+        if not combined_files:
+            raise Exception("None of the selected videos could be converted.")
+
+        # Zip the MKVs from disk and upload the archive as it is produced
+        report(None, 'uploading')
+        zip_blob_name = f"{str(uuid.uuid4())}.zip"
+        # 'upload' covers the whole streamed upload, 'zip' the part of it spent building the archive
+        with trace.span('upload') as span:
+            chunks = metrics.metered(create_zip(combined_files), 'zip', trace)
+            url = upload_to_azure(zip_blob_name, chunks)
+            span.bytes = sum(s.bytes for s in trace.spans if s.stage == 'zip')
+        status = 'done'
+        return url
+    finally:
+        workspace.cleanup()
+        trace.finish(status)
 
 # Function to render a download page with the download URL
 @app.route('/download_page')
@@ -125,348 +362,326 @@ def download_page():
     else:
         return "No download URL found.", 400
 
-def fetch_and_decompress_gz(gz_url):
-    response = requests.get(gz_url, stream=True)
-    if response.status_code == 200:
-        gz_data = io.BytesIO(response.content)
-        with gzip.GzipFile(fileobj=gz_data, mode='rb') as f:
-            extracted_titles = []
-            for line in f:
-                try:
-                    json_obj = json.loads(line.decode('utf-8'))
-                    o = json_obj.get('o', {})
-                    if json_obj['type'] == 'media-item' and o.get('keyParts', {}).get('formatCode') == 'VIDEO':
-                        extracted_titles.append(o)
-                except json.JSONDecodeError:
-                    continue
-            return extracted_titles
-    else:
-        raise Exception(f"Failed to download gz file from {gz_url}")
-    
-# Function to create a ZIP file containing all the converted audio files in memory
-def create_zip(media_streams):
-    zip_stream = BytesIO()
-    with zipfile.ZipFile(zip_stream, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for media_dict in media_streams:
-            for file_name, media_stream in media_dict.items():  # Unpack the dictionary
-                media_stream.seek(0)  # Reset the position of each audio stream
-                zip_file.writestr(file_name, media_stream.read())  # Use the file name from the dictionary
-    zip_stream.seek(0)  # Reset stream position to the beginning of the zip
-    return zip_stream  # Return the in-memory zip stream
+# Function to create a ZIP stream of the converted files on disk
+def create_zip(media_files):
+    """
+    Return the ZIP of media_files, a list of {file_name: path} dicts, as an iterator of byte chunks.
+    Media is stored uncompressed and read from disk chunk by chunk, so nothing is buffered in memory.
+    """
+    entries = [(file_name, path) for media_dict in media_files for file_name, path in media_dict.items()]
+    return iter_zip(entries)
 
 def upload_to_azure(blob_name, zip_buffer):
-    blob_client = container_client.get_blob_client(blob_name)
-    # Upload the audio stream directly to Azure Blob Storage
-    blob_client.upload_blob(zip_buffer, blob_type="BlockBlob", overwrite=True)
-    return blob_client.url  # Return the URL of the uploaded blob
+    """
+    Upload zip_buffer (a file-like object or an iterator of byte chunks) as a block blob.
+    Blocks are staged in parallel as the data arrives, then committed. Returns the blob URL.
+    """
+    blob_client = get_container_client().get_blob_client(blob_name)
+    if hasattr(zip_buffer, 'read'):
+        zip_buffer = iter(lambda: zip_buffer.read(UPLOAD_BLOCK_SIZE), b'')
+    return block_uploader.upload(blob_client, zip_buffer)  # Return the URL of the uploaded blob
 
-def fetch_download_links(language_agnostic_natural_key):
+_container_client = None
+_container_lock = threading.Lock()
+
+def get_container_client():
+    """
+    Build the Azure container client on first use, so importing the app doesn't load the
+    Azure SDK or need storage credentials. The container is created if missing, e.g. on a
+    fresh Azurite emulator.
     """
-    Fetch the download links for both the English and Chinese Simplified versions of the video.
-    Returns the largest video for both languages along with subtitle URLs if available.
+    global _container_client
+    with _container_lock:
+        if _container_client is None:
+            from azure.storage.blob import BlobServiceClient
+            from azure.core.exceptions import ResourceExistsError
+            blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
+            container_client = blob_service_client.get_container_client(AZURE_CONTAINER_NAME)
+            try:
+                container_client.create_container()
+            except ResourceExistsError:
+                pass
+            _container_client = container_client
+        return _container_client
+
+def fetch_download_links(language_agnostic_natural_key, languages=DEFAULT_LANGUAGES):
+    """
+    Fetch the download links for the video in each of languages (JW codes, see languages.py).
+    Returns one entry per language, in order: the largest video for the first language, which
+    supplies the picture, and for the others the rendition chosen by SECONDARY_RENDITION, as only
+    their audio is used; along with subtitle URLs if available.
     """
     def get_largest_file(media_data):
         return max(media_data['files'], key=lambda f: f['filesize'])
-    
-    base_url = "https://b.jw-cdn.org/apis/mediator/v1/media-items"
 
-    # Fetch English media
-    url_en = f"{base_url}/E/{language_agnostic_natural_key}?clientType=www"
-    response_en = requests.get(url_en)
-    
-    # Fetch Chinese Simplified media
-    url_chs = f"{base_url}/CHS/{language_agnostic_natural_key}?clientType=www"
-    response_chs = requests.get(url_chs)
-    
-    if response_en.status_code == 200 and response_chs.status_code == 200:
-        media_data_en = response_en.json().get('media', [])[0]
-        media_data_chs = response_chs.json().get('media', [])[0]
-
-        # Extract the largest video/audio file for each language
-        largest_en = get_largest_file(media_data_en)
-        largest_chs = get_largest_file(media_data_chs)
-
-        # Fetch subtitles if available
-        sub_e_url = largest_en.get('subtitles', {}).get('url')
-        subtitles_en = sub_e_url if sub_e_url else 'None'
-        sub_chs_url = largest_chs.get('subtitles', {}).get('url')
-        subtitles_chs = sub_chs_url if sub_chs_url else 'None'
-
-        return {
-            "en": {
-                "video_url": str(largest_en['progressiveDownloadURL']),
-                "subtitles_url": str(subtitles_en),
-                "title": str(media_data_en['title'])
-            },
-            "chs": {
-                "video_url": str(largest_chs['progressiveDownloadURL']),
-                "subtitles_url": str(subtitles_chs),
-                "title": str(media_data_chs['title'])
-            }
-        }
-    else:
-        raise Exception("Failed to retrieve download links for one or both languages.")
-
-def download_file(url):
-    """Download the content from a URL and return it as a BytesIO object."""
-    response = requests.get(url, stream=True)
-    if response.status_code == 200:
-        stream = BytesIO()
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                stream.write(chunk)
-        stream.seek(0)  # Reset the stream position to the beginning
-
-        return stream
-    else:
-        raise Exception(f"Failed to download file from {url}")
-
-# Function to download video and audio and write to a temporary file
-def download_to_tempfile(url):
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        # Extract the file extension from the URL   
-
-        extension = os.path.splitext(url)[1]
-
-        # Create a temporary file with the appropriate extension
-        with tempfile.NamedTemporaryFile(delete=False, suffix=extension) as temp_file:
-            temp_file.write(response.content)
-
-            return temp_file.name  # Return the path of the temporary file
-    else:
-        raise Exception(f"Failed to download from {url}")
-    
-# Function to convert VTT to SRT and return the content as a BytesIO object
-def convert_vtt_to_temp_srt(vtt_filepath):
-    # Create a temporary SRT file with automatic deletion
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".vtt") as temp_srt:
-        # Open and read the VTT file
-        with open(vtt_filepath, 'r', encoding='utf-8') as vtt_file:
-            vtt_content = vtt_file.read()
-
-        # Remove the WEBVTT header
-        srt_content = re.sub(r'WEBVTT\s*\n', '', vtt_content)
-
-        # Replace VTT cue timing format (00:00:00.000 --> 00:00:00.000) with SRT format (00:00:00,000 --> 00:00:00,000)
-        srt_content = re.sub(r'(\d+:\d+:\d+)\.(\d+)', r'\1,\2', srt_content)
-
-        # Remove formatting attributes like line, position, align
-        srt_content = re.sub(r'(\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}).*', r'\1', srt_content)
-
-        # Add SRT sequence numbers
-        srt_blocks = srt_content.strip().split('\n\n')
-        srt_content_with_numbers = ""
-        for i, block in enumerate(srt_blocks):
-            srt_content_with_numbers += f"{i + 1}\n{block.strip()}\n\n"
-
-        # Write the final SRT content to the temporary file
-        temp_srt.write(srt_content_with_numbers.encode('utf-8'))
-        temp_srt.flush()  # Ensure the content is written
-
-        # Rewind and read the content into a BytesIO object
-        temp_srt.seek(0)
-        srt_bytes = io.BytesIO(temp_srt.read())
-        
-    os.remove(temp_srt.name)
-
-    return srt_bytes  # Return the bytes from the BytesIO object
+    def get_smallest_file(media_data):
+        return min(media_data['files'], key=lambda f: f['filesize'])
+
+    def get_subtitles(media_data, preferred):
+        # Small renditions don't always list the subtitles, so fall back to any file that does
+        for file in [preferred] + media_data['files']:
+            if file.get('subtitles', {}).get('url'):
+                return file['subtitles']
+        return {}
+
+    # All languages are looked up concurrently; process_job has usually cached them already
+    media_items = mediator.media_items([language_agnostic_natural_key], languages)
+
+    entries = []
+    for position, code in enumerate(languages):
+        media_data = media_items[(code, language_agnostic_natural_key)]
+        if isinstance(media_data, Exception):
+            raise media_data
+
+        if position == 0 or SECONDARY_RENDITION == 'largest':
+            file = get_largest_file(media_data)
+        else:
+            file = get_smallest_file(media_data)
+        subtitles = get_subtitles(media_data, file)
+
+        entries.append({
+            "code": code,
+            "video_url": str(file['progressiveDownloadURL']),
+            "filesize": file.get('filesize'),
+            "checksum": file.get('checksum'),
+            "subtitles_url": subtitles.get('url'),
+            "subtitles_checksum": subtitles.get('checksum'),
+            "title": str(media_data['title'])
+        })
+    return {"languages": entries}
+
+def media_urls(video_info, videos=True):
+    """
+    Return {role: url} for the files of video_info: 'video_<code>' for each language's video
+    (unless videos is false) and 'subtitles_<code>' for its subtitles, if any.
+    """
+    urls = {}
+    for info in video_info['languages']:
+        if videos:
+            urls[f"video_{info['code']}"] = info['video_url']
+        if info['subtitles_url']:
+            urls[f"subtitles_{info['code']}"] = info['subtitles_url']
+    return urls
+
+def result_key(video_info):
+    """
+    Cache key for the MKV built from video_info: the languages and their track titles,
+    the identities of every input file and the output format version.
+    """
+    identities = sorted(media_identities(video_info).items())
+    titles = [(info['code'], info['title']) for info in video_info['languages']]
+    return cache_key(RESULT_FORMAT_VERSION, titles, identities)
 
-    # The temporary file is deleted when the block exits, but the BytesIO stream retains the content
-    print(f"Converted {vtt_filepath} to SRT and delivered as BytesIO")
+def scratch_estimate(video_info):
+    """
+    Scratch space needed to convert video_info: the MKV, plus the downloaded videos
+    unless they are streamed into the mux.
+    """
+    video_bytes = sum(info.get('filesize') or 0 for info in video_info['languages'])
+    copies = 1 if MUX_MODE == 'stream' else 2
+    return copies * video_bytes + SCRATCH_OVERHEAD_BYTES
 
-def combine_streams(video_info):
+def job_estimate(keys, languages):
     """
-    Combine English and Chinese videos and subtitles into a single file.
+    Return (bytes, unknown) for a job converting keys in languages. bytes is what the job is
+    expected to hold while it runs: the scratch space of every video, from the mediator's
+    file sizes, plus the upload buffers. Videos the mediator doesn't have count only their
+    overhead, as the job will report them as failed. unknown is the number of videos whose
+    lookup took longer than JOB_ESTIMATE_TIMEOUT, which bytes leaves out.
     """
-    try:
-        english_title = video_info['en']['title']
-        chinese_title = video_info['chs']['title']
-        video_en_url = video_info['en']['video_url']
-        video_chs_url = video_info['chs']['video_url']
-        subtitles_en_url = video_info['en']['subtitles_url'] if video_info['en']['subtitles_url'] != 'None' else None
-        subtitles_chs_url = video_info['chs']['subtitles_url'] if video_info['chs']['subtitles_url'] != 'None' else None
-
-        # Combine the audio and subtitles using ffmpeg
-        #combined_stream = do_ffmpeg(english_title, chinese_title, video_en_url, video_chs_url, subtitles_en_url, subtitles_chs_url)
-        combined_stream = do_mkvmerge(english_title, chinese_title, video_en_url, video_chs_url, subtitles_en_url, subtitles_chs_url)
-
-        return combined_stream
-    except Exception as e:
-        print(f"Error during conversion: {e}")
-        return None
-    
-def do_mkvmerge(english_title, chinese_title, video_en, video_chs, subtitles_en=None, subtitles_chs=None):
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_en, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".mp4") as temp_video_chs, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".vtt") as temp_subtitles_en, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".srt") as temp_srt_en, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".vtt") as temp_subtitles_chs, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".srt") as temp_srt_chs, \
-             tempfile.NamedTemporaryFile(delete=False, suffix=".srt") as temp_srt_pinyin:
-            
-            temp_video_en.write(download_file(video_en).read())
-            temp_video_en.seek(0)  # Rewind
-
-            temp_video_chs.write(download_file(video_chs).read())
-            temp_video_chs.seek(0)  # Rewind
-            
-            if subtitles_en:
-                temp_subtitles_en.write(download_file(subtitles_en).read())
-                temp_subtitles_en.seek(0)  # Rewind
-                temp_srt_en.write(convert_vtt_to_temp_srt(temp_subtitles_en.name).read())
-                temp_srt_en.seek(0)  # Rewind
-            if subtitles_chs:
-                temp_subtitles_chs.write(download_file(subtitles_chs).read())
-                temp_subtitles_chs.seek(0)  # Rewind
-                temp_srt_chs.write(convert_vtt_to_temp_srt(temp_subtitles_chs.name).read())
-                temp_srt_chs.seek(0)  # Rewind
-                processor = SubtitleProcessor()
-                processor.generate_pinyin_subtitle_file(temp_srt_chs.name, temp_srt_pinyin.name)
-                temp_srt_pinyin.seek(0)  # Rewind
-        
-            # Create an MKVFile object
-            mkv = MKVFile()
-
-            # Add the English video and audio tracks
-            mkv.add_track(MKVTrack(temp_video_en.name, track_id=0))
-            mkv.add_track(MKVTrack(temp_video_en.name, track_id=1, language="eng", track_name=english_title))
-
-            # Add the Chinese audio track
-            mkv.add_track(MKVTrack(temp_video_chs.name, track_id=1, language="chi", track_name=chinese_title))
-
-            # Add subtitle tracks if available
-            if subtitles_en:
-                mkv.add_track(MKVTrack(temp_srt_en.name, language="eng", track_name="English"))
-
-            if subtitles_chs:
-                mkv.add_track(MKVTrack(temp_srt_chs.name, language="chi", track_name="中文"))
-                mkv.add_track(MKVTrack(temp_srt_pinyin.name, language="chi", track_name="Pīnyīn"))
-
-            temp_mkv_file = os.path.join(ROOT.parent, "output.mkv")
-            mkv.mux(temp_mkv_file)
-
-            with open(temp_mkv_file, 'rb') as f:
-                stream = io.BytesIO(f.read())
-                            
-            print("MKV file created successfully.")
-            return stream
-    except Exception as e:
-        # Delete the temporary files
-        os.remove(temp_mkv_file)
-        for temp_file in [temp_video_en, temp_video_chs, temp_subtitles_en, 
-                            temp_srt_en, temp_subtitles_chs, temp_srt_chs, temp_srt_pinyin]:
-            temp_file.close()
-            os.remove(temp_file.name)
-        print(f"An error occurred: {e}")
-        raise
-    finally:
-        # Delete the temporary files
-        os.remove(temp_mkv_file)
-        for temp_file in [temp_video_en, temp_video_chs, temp_subtitles_en, 
-                            temp_srt_en, temp_subtitles_chs, temp_srt_chs, temp_srt_pinyin]:
-            temp_file.close()
-            os.remove(temp_file.name)
-
-def do_ffmpeg(english_title, chinese_title, video_en_url, video_chs_url, subtitles_en_url=None, subtitles_chs_url=None):
+    # One concurrent round of lookups, which also leaves the entries cached for the job itself
+    lookups = mediator.media_items(keys, languages, timeout=JOB_ESTIMATE_TIMEOUT)
+    slow = {key for (_, key), media in lookups.items() if isinstance(media, TimeoutError)}
+    failed = {key for (_, key), media in lookups.items() if isinstance(media, Exception)} - slow
+    total = JOB_MEMORY_BYTES
+    for key in keys:
+        if key in slow:
+            continue
+        try:
+            if key in failed:
+                raise Exception(f"No media found for {key}")
+            total += scratch_estimate(fetch_download_links(key, languages))
+        except Exception:
+            total += SCRATCH_OVERHEAD_BYTES
+    return total, len(slow)
+
+def media_identities(video_info):
     """
-    Combine English and Chinese audio streams and subtitles into a single MKV file.
-    Returns the MKV file as a file stream.
+    Return {url: (checksum, filesize)} for the files in video_info, as reported by the mediator.
+    Together with the URL, these identify a file's exact content.
     """
-    # Download English video
-    video_en = download_file(video_en_url)
-    # Download Chinese video
-    video_chs = download_file(video_chs_url)
-
-    if video_en is None or video_chs is None:
-        raise ValueError("Video streams cannot be None")
-
-    # Download subtitles (if available)
-    if subtitles_en_url is not None:
-        subtitles_en = download_file(subtitles_en_url)
-    if subtitles_chs_url is not None:
-        subtitles_chs = download_file(subtitles_chs_url)
-    
-    output_stream = BytesIO()
-
-    with tempfile.NamedTemporaryFile(delete=False) as temp_video_en, \
-         tempfile.NamedTemporaryFile(delete=False) as temp_video_chs:
-        
-        # Write video streams to temporary files
-        temp_video_en.write(video_en.getvalue())
-        temp_video_chs.write(video_chs.getvalue())
-
-        command = [
-            'ffmpeg', '-y',  # Overwrite output file if exists
-            '-i', temp_video_en.name,  # English video input (temp file)
-            '-i', temp_video_chs.name  # Chinese video input (temp file)
-        ]
-
-        # Add subtitles input commands
-        if subtitles_en:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_subtitles_en:
-                temp_subtitles_en.write(subtitles_en.getvalue())
-                command.extend(['-i', temp_subtitles_en.name])  # English subtitle input
-
-        if subtitles_chs:
-            with tempfile.NamedTemporaryFile(delete=False) as temp_subtitles_chs:
-                temp_subtitles_chs.write(subtitles_chs.getvalue())
-                command.extend(['-i', temp_subtitles_chs.name])  # Chinese subtitle input
-
-        # Map the audio and video streams
-        command.extend([
-            '-map_metadata', '0',
-            '-c:v', 'copy', '-c:a', 'copy',  # Copy video and audio codecs, no transcoding
-            '-map', '0:v:0',  # Map the video stream from the primary file
-            '-map', '0:a:0',  # Map the audio stream from the primary file
-            '-map', '1:a:0',  # Map Chinese audio
-        ])
-
-        # Add subtitle streams if available
-        if subtitles_en:
-            command.extend(['-map', '2:s:0', '-c:s:0', 'srt'])  # Map and set codec for English subtitles
-        if subtitles_chs:
-            command.extend(['-map', '3:s:0', '-c:s:1', 'srt'])  # Map and set codec for Chinese subtitles
-
-        # Add metadata for audio streams
-        command.extend([
-            '-metadata:s:a:0', f'title={english_title}', '-metadata:s:a:0', 'language=eng',  # Metadata for English audio
-            '-metadata:s:a:1', f'title={chinese_title}', '-metadata:s:a:1', 'language=chi',  # Metadata for Chinese audio
-        ])
-
-        # Add metadata for subtitle streams
-        if subtitles_en:
-            command.extend(['-metadata:s:s:0', 'language=eng', '-metadata:s:s:0', 'title=English'])  # Metadata for English subtitles
-        if subtitles_chs:
-            command.extend(['-metadata:s:s:1', 'language=chi', '-metadata:s:s:1', 'title=中文'])  # Metadata for Chinese subtitles
-
-        command.extend(['-f', 'matroska', 'pipe:1'])  # Output as MKV format to stdout
-
-        # Run the ffmpeg process and capture output
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    identities = {}
+    for info in video_info['languages']:
+        identities[info['video_url']] = (info.get('checksum'), info.get('filesize'))
+        if info['subtitles_url']:
+            identities[info['subtitles_url']] = (info.get('subtitles_checksum'), None)
+    return identities
+
+def fetch_inputs(workdir, video_info, trace=None, index=None):
+    """Download what mux_video needs into workdir: in stream mode only the subtitles."""
+    urls = media_urls(video_info, videos=MUX_MODE != 'stream')
+    return download_media(workdir, urls, identities=media_identities(video_info), trace=trace, index=index)
+
+def download_media(workdir, urls, identities=None, trace=None, index=None):
+    """
+    Download the files in urls, a {role: url} dict from media_urls, into workdir.
+    Files are streamed straight to disk; identities maps URLs to their (checksum, filesize),
+    if known. Files with a known checksum are served from the local media cache when possible.
+    Download times, bytes and cache lookups are recorded in trace, if given.
+    Returns a dict of local file paths, keyed by role.
+    """
+    identities = identities or {}
+
+    def download(path, url):
+        checksum, filesize = identities.get(url, (None, None))
+        with metrics.span('download', trace, index) as span:
+            if media_cache.enabled and checksum:
+                fill = lambda tmp_path: download_to_path(url, tmp_path, expected_size=filesize)
+                hit = media_cache.fetch_to(cache_key(url, checksum, filesize), path, fill)
+                if trace is not None:
+                    trace.cache_lookup('media', hit)
+                if hit:
+                    span.stage = 'download_cached'
+            else:
+                download_to_path(url, path, expected_size=filesize)
+            span.bytes = os.path.getsize(path)
+
+    files = {}
+    for role in urls:
+        extension = '.mp4' if role.startswith('video_') else '.vtt'
+        files[role] = os.path.join(workdir, role + extension)
+
+    # Every language's video and subtitles are fetched at the same time
+    http_client.gather(*[(download, files[role], url) for role, url in urls.items()])
+    return files
+
+def prepare_subtitles(files, trace=None, index=None):
+    """
+    Convert the downloaded VTT subtitles to SRT, and generate the pinyin track for languages
+    that have one. Adds the new paths to files and returns it.
+    """
+    for role, path in list(files.items()):
+        if not role.startswith('subtitles_'):
+            continue
+        code = role[len('subtitles_'):]
+        workdir = os.path.dirname(path)
+        with metrics.span('subtitles', trace, index) as span:
+            cues = read_cues(path)
+            files[f'srt_{code}'] = os.path.join(workdir, f'subtitles_{code}.srt')
+            write_srt(files[f'srt_{code}'], cues)
+            span.bytes = os.path.getsize(path)
+        if LANGUAGES[code].pinyin:
+            from subtitle_processor import pinyin_cues
+            with metrics.span('pinyin', trace, index):
+                files[f'srt_{code}_pinyin'] = os.path.join(workdir, f'subtitles_{code}_pinyin.srt')
+                # Segmentation and pinyin hold the GIL, so they run in a worker process
+                write_srt(files[f'srt_{code}_pinyin'], pipeline.run_in_process(pinyin_cues, cues))
+    return files
+
+def read_cues(vtt_filepath):
+    with open(vtt_filepath, 'rb') as f:
+        return parse_vtt(f.read())
+
+def write_srt(path, cues):
+    with open(path, 'wb') as f:
+        f.write(format_srt(cues))
+
+def audio_tracks(video_info, files):
+    """
+    Return the audio tracks as (source, language, title), one per language in order. The source
+    is the downloaded video if there is one, otherwise its URL; the first one also supplies the video.
+    """
+    return [(files.get(f"video_{info['code']}", info['video_url']), LANGUAGES[info['code']].iso, info['title'])
+            for info in video_info['languages']]
+
+def subtitle_tracks(video_info, files):
+    """Return the prepared subtitle tracks in files as (path, language, title), in track order."""
+    tracks = []
+    for info in video_info['languages']:
+        language = LANGUAGES[info['code']]
+        if f"srt_{language.code}" in files:
+            tracks.append((files[f"srt_{language.code}"], language.iso, language.name))
+        if f"srt_{language.code}_pinyin" in files:
+            tracks.append((files[f"srt_{language.code}_pinyin"], language.iso, "Pīnyīn"))
+    return tracks
+
+def mux_video(video_info, files, output_path):
+    """Build the MKV for video_info at output_path from the files fetch_inputs prepared."""
+    audio, subtitles = audio_tracks(video_info, files), subtitle_tracks(video_info, files)
+    if MUX_MODE == 'stream':
+        stream_mux(audio, subtitles, output_path)
+    else:
+        mux_mkv(audio, subtitles, output_path)
+    return output_path
+
+def mux_mkv(audio, subtitles, output_path):
+    """
+    Mux the video of the first audio source, every audio track and the subtitle tracks into
+    a single MKV at output_path. Tracks are (path, language, title) tuples.
+    """
+    from pymkv import MKVFile, MKVTrack
+
+    # Create an MKVFile object
+    mkv = MKVFile()
+
+    # Add the video track of the first language
+    mkv.add_track(MKVTrack(audio[0][0], track_id=0))
+
+    # Add one audio track per language
+    for path, language, title in audio:
+        mkv.add_track(MKVTrack(path, track_id=1, language=language, track_name=title))
+
+    # Add subtitle tracks if available
+    for path, language, title in subtitles:
+        mkv.add_track(MKVTrack(path, language=language, track_name=title))
+
+    mkv.mux(output_path)
+    return output_path
+
+job_queue = JobQueue(JOBS_DB, process_job, concurrency=JOB_CONCURRENCY, retention=JOB_RETENTION,
+                     max_bytes=JOB_MAX_BYTES, max_queued=JOB_MAX_QUEUED, retry_after=JOB_RETRY_AFTER)
+
+def start_background_workers():
+    """Start the job queue threads. Under gunicorn this runs in each worker after the fork."""
+    job_queue.start()
+
+def collect_service_metrics():
+    """Cache, job queue and startup figures for /metrics, read at scrape time."""
+    samples = []
+    for name, cache in (('media', media_cache), ('results', result_cache)):
+        if not cache.enabled:
+            continue
+        for field, value in cache.stats().items():
+            samples.append((f'jwmc_file_cache_{field}', {'cache': name}, value))
+    for field, value in job_queue.stats().items():
+        samples.append((f'jwmc_jobs_{field}', {}, value))
+    for phase, seconds in warmup.STARTUP_TIMINGS.items():
+        samples.append(('jwmc_startup_seconds', {'phase': phase}, seconds))
+    return samples
+
+metrics.REGISTRY.register_collector(collect_service_metrics)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    if 'request_started' in g:
+        elapsed = time.perf_counter() - g.request_started
+        if 'first_request' not in warmup.STARTUP_TIMINGS:
+            warmup.record('first_request', elapsed)
+        endpoint = request.endpoint or 'unknown'
+        metrics.REGISTRY.inc('jwmc_http_requests_total', endpoint=endpoint, status=response.status_code)
+        metrics.REGISTRY.observe('jwmc_http_request_seconds', elapsed, endpoint=endpoint)
+    return response
+
+# gunicorn.conf.py sets DEFER_BACKGROUND_START so that no threads are started before the fork.
+# Under `python main.py`, the pipeline's spawned worker processes import this module as __mp_main__
+if not os.getenv('DEFER_BACKGROUND_START') and __name__ != '__mp_main__':
+    start_background_workers()
+
+warmup.record('app_import', time.perf_counter() - IMPORT_STARTED)
 
-        try:
-            # Read the stdout (output MKV stream) and write it to output_stream
-            output, error = process.communicate()
-
-            if process.returncode != 0:
-                print(f"FFmpeg error: {error.decode('utf-8')}")
-                raise Exception("Error during FFmpeg processing")
-
-            output_stream.write(output)
-            output_stream.seek(0)  # Reset stream pointer for reading
-            return output_stream
-
-        finally:
-            # Clean up the temporary filess
-            temp_files = [temp_video_en, temp_video_chs, temp_subtitles_en, temp_subtitles_chs]
-            for temp_file in temp_files:
-                try:
-                    os.remove(temp_file.name)
-                except OSError:
-                    pass
-      
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,244 @@
+import os
+import time
+import uuid
+import errno
+import shutil
+import zlib
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; locking is then per process only
+    fcntl = None
+
+# Entries share a fixed set of locks, so lock state doesn't grow with the number of keys
+LOCK_STRIPES = 1024
+
+def cache_key(*parts):
+    """Build a cache key from identifying parts, e.g. URL, checksum and file size."""
+    return hashlib.sha256('\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+def link_or_copy(src, dest):
+    """Hard-link src to dest when on the same filesystem, otherwise copy it."""
+    try:
+        os.link(src, dest)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copyfile(src, dest)
+
+class FileCache:
+    """
+    Content-addressed file cache on local disk with an LRU size cap.
+
+    Entries are written to a temp file and renamed into place, so readers never see a
+    partial file. Concurrent requests for the same entry, from any thread or gunicorn
+    worker, wait for a single download instead of repeating it: the first claims the fill
+    with a per-key sentinel file in locks/ (flocked while the download runs, removed after)
+    and the others block on it. The download itself runs outside the entry locks, which are
+    striped over LOCK_STRIPES and only held to check, claim and publish an entry, so
+    unrelated keys never wait on each other's downloads.
+    Cached files are hard-linked into the caller's directory, so evicting an entry never
+    breaks a conversion that is using it.
+    """
+    def __init__(self, cache_dir, max_bytes, stale_part_age=24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.stale_part_age = stale_part_age
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.locks_dir = os.path.join(cache_dir, 'locks')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.locks_dir, exist_ok=True)
+        self._stats_lock = threading.Lock()
+        self._thread_locks = {name: threading.Lock() for name in self._stripe_names()}
+        self._filling = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def path_for(self, key):
+        return os.path.join(self.objects_dir, key[:2], key)
+
+    @staticmethod
+    def _stripe_names():
+        return ['evict'] + [f"stripe-{i:04d}" for i in range(LOCK_STRIPES)]
+
+    def _lock_name(self, key):
+        if key == 'evict':
+            return key
+        return f"stripe-{zlib.crc32(key.encode('utf-8')) % LOCK_STRIPES:04d}"
+
+    @contextmanager
+    def _lock(self, key, blocking=True):
+        """Exclusive lock shared across threads and processes. Yields False if not acquired."""
+        name = self._lock_name(key)
+        thread_lock = self._thread_locks[name]
+        if not thread_lock.acquire(blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            with open(os.path.join(self.locks_dir, name + '.lock'), 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def contains(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def fetch_to(self, key, dest, fill):
+        """
+        Place the entry for key at dest, calling fill(path) to create it on a miss.
+        Returns True on a cache hit.
+        """
+        path = self.path_for(key)
+        while True:
+            with self._lock(key):
+                if os.path.exists(path):
+                    # mtime tracks last use for LRU eviction
+                    os.utime(path)
+                    link_or_copy(path, dest)
+                    self._count('hits')
+                    return True
+                claim = self._claim_fill(key)
+            if claim.owner:
+                break
+            # Another thread or worker is filling it; look again once it is done
+            claim.wait()
+
+        self._count('misses')
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            try:
+                fill(tmp_path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            with self._lock(key):
+                os.replace(tmp_path, path)
+                link_or_copy(path, dest)
+        finally:
+            with self._lock(key):
+                claim.release()
+        self.evict(keep=key)
+        return False
+
+    def _claim_fill(self, key):
+        """Claim the right to fill key, or return a claim to wait on. Call with the key's lock held."""
+        event = self._filling.get(key)
+        if event is not None:
+            return _FillClaim(self, key, owner=False, event=event)
+        sentinel = None
+        if fcntl is not None:
+            sentinel = open(os.path.join(self.locks_dir, key + '.fill'), 'a')
+            try:
+                fcntl.flock(sentinel, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return _FillClaim(self, key, owner=False, sentinel=sentinel)
+        self._filling[key] = threading.Event()
+        return _FillClaim(self, key, owner=True, event=self._filling[key], sentinel=sentinel)
+
+    def _entries(self):
+        """Yield (mtime, size, key, path) for every cache entry, removing stale partial files."""
+        now = time.time()
+        for shard in os.scandir(self.objects_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith('.part'):
+                    if now - st.st_mtime > self.stale_part_age:
+                        os.remove(entry.path)
+                    continue
+                yield st.st_mtime, st.st_size, entry.name, entry.path
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in max_bytes."""
+        with self._lock('evict', blocking=False) as acquired:
+            if not acquired:
+                # Another thread or worker is already evicting
+                return
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _, _ in entries)
+            for _, size, key, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                # Skip entries that are being written or linked right now
+                with self._lock(key, blocking=False) as locked:
+                    if not locked:
+                        continue
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+                self._count('evictions')
+
+    def stats(self):
+        entries = list(self._entries())
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "files": len(entries),
+                "bytes": sum(size for _, size, _, _ in entries),
+                "max_bytes": self.max_bytes,
+            }
+
+class _FillClaim:
+    """One caller's stake in filling a cache entry: either the filler, or waiting for it."""
+    def __init__(self, cache, key, owner, event=None, sentinel=None):
+        self.cache = cache
+        self.key = key
+        self.owner = owner
+        self.event = event
+        self.sentinel = sentinel
+
+    def wait(self):
+        if self.event is not None:
+            self.event.wait()
+            return
+        # Held by a filler in another process until it finishes or dies
+        try:
+            fcntl.flock(self.sentinel, fcntl.LOCK_EX)
+        finally:
+            self.sentinel.close()
+
+    def release(self):
+        """Called by the filler, with the key's lock held."""
+        del self.cache._filling[self.key]
+        self.event.set()
+        if self.sentinel is not None:
+            try:
+                os.remove(self.sentinel.name)
+            except FileNotFoundError:
+                pass
+            self.sentinel.close()
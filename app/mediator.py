@@ -0,0 +1,81 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import wait
+import http_client
+
+MEDIATOR_URL = os.getenv('MEDIATOR_URL', "https://b.jw-cdn.org/apis/mediator/v1/media-items")
+
+class MediatorClient:
+    """
+    Looks up media items in the mediator API, one request per (language, key).
+
+    Responses are cached in memory for ttl seconds, so a batch that asks for the same
+    video in several languages, or jobs repeating recent selections, don't repeat the
+    round trips. Failed lookups are not cached.
+    """
+    def __init__(self, base_url=MEDIATOR_URL, ttl=300, max_entries=4096):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, language, key):
+        with self._lock:
+            entry = self._cache.get((language, key))
+            if entry is None:
+                return None
+            expires, media = entry
+            if expires < time.monotonic():
+                del self._cache[(language, key)]
+                return None
+            return media
+
+    def _store(self, language, key, media):
+        with self._lock:
+            self._cache[(language, key)] = (time.monotonic() + self.ttl, media)
+            self._cache.move_to_end((language, key))
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def media_item(self, language, key):
+        """Return the mediator's media entry for key in language, with its title and files."""
+        media = self._cached(language, key)
+        if media is not None:
+            return media
+        response = http_client.get(f"{self.base_url}/{language}/{key}?clientType=www")
+        if response.status_code != 200:
+            raise Exception(f"Failed to retrieve media item {key} in language {language}: HTTP {response.status_code}")
+        items = response.json().get('media', [])
+        if not items:
+            raise Exception(f"Media item {key} is not available in language {language}")
+        self._store(language, key, items[0])
+        return items[0]
+
+    def media_items(self, keys, languages, timeout=None):
+        """
+        Look up every key in every language concurrently, and return
+        {(language, key): media entry or the exception raised for it}.
+        With a timeout, lookups still running after that many seconds are reported as
+        TimeoutError; they carry on in the background and are cached when they finish.
+        """
+        pairs = list(dict.fromkeys((language, key) for key in keys for language in languages))
+
+        def lookup(language, key):
+            try:
+                return self.media_item(language, key)
+            except Exception as e:
+                return e
+
+        futures = [http_client.submit(lookup, language, key, pool='lookups') for language, key in pairs]
+        done, _ = wait(futures, timeout)
+        results = [future.result() if future in done else
+                   TimeoutError(f"Media item {key} in language {language} took over {timeout}s to look up")
+                   for (language, key), future in zip(pairs, futures)]
+        return dict(zip(pairs, results))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,276 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; peak memory is then not reported
+    resource = None
+
+# Upper bounds in seconds of the duration histogram buckets
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+class Registry:
+    """
+    Counters and duration histograms, plus collectors for values read on demand, rendered in
+    the Prometheus text format.
+
+    Every process keeps its own registry. Under gunicorn each worker answers /metrics with
+    its own numbers, so scrape the workers individually or run one worker per instance.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            buckets, total, count = series.get(key, ([0] * len(DURATION_BUCKETS), 0.0, 0))
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            series[key] = (buckets, total + seconds, count + 1)
+
+    def register_collector(self, collect):
+        """collect() returns [(name, labels dict, value)], read each time the metrics are rendered."""
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+
+        def header(name, default_kind):
+            kind, help_text = self._help.get(name, (default_kind, ''))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            header(name, 'counter')
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            header(name, 'histogram')
+            for key, (buckets, total, count) in sorted(series.items()):
+                for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {bucket_count}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+
+        collected = {}
+        for collect in self._collectors:
+            try:
+                for name, labels, value in collect():
+                    collected.setdefault(name, []).append((_label_key(labels), value))
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        for name, series in sorted(collected.items()):
+            header(name, 'gauge')
+            for key, value in series:
+                lines.append(f"{name}{_format_labels(key)} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+REGISTRY.describe('jwmc_stage_seconds', 'histogram', "Time spent in each conversion stage")
+REGISTRY.describe('jwmc_stage_bytes_total', 'counter', "Bytes moved by each conversion stage")
+REGISTRY.describe('jwmc_cache_requests_total', 'counter', "Cache lookups made by conversion jobs, by cache and result")
+REGISTRY.describe('jwmc_jobs_total', 'counter', "Finished conversion jobs, by status")
+REGISTRY.describe('jwmc_job_seconds', 'histogram', "Total run time of conversion jobs")
+REGISTRY.describe('jwmc_admissions_total', 'counter', "Conversion requests accepted or turned away by admission control")
+REGISTRY.describe('jwmc_http_requests_total', 'counter', "HTTP requests served, by endpoint and status")
+REGISTRY.describe('jwmc_http_request_seconds', 'histogram', "HTTP request latency, by endpoint")
+
+def peak_rss_bytes():
+    """Return the peak resident memory of this process and of its largest finished child (e.g. mkvmerge)."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024)
+
+def rss_bytes():
+    """Return the current resident memory of this process, or None where /proc isn't available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _process_metrics():
+    peak, peak_children = peak_rss_bytes()
+    current = rss_bytes()
+    return [(name, {}, value) for name, value in (('jwmc_process_resident_memory_bytes', current),
+                                                  ('jwmc_process_peak_resident_memory_bytes', peak),
+                                                  ('jwmc_children_peak_resident_memory_bytes', peak_children))
+            if value is not None]
+
+REGISTRY.register_collector(_process_metrics)
+
+class Span:
+    """One timed stage: set bytes to the amount of data the stage moved."""
+    __slots__ = ('stage', 'index', 'seconds', 'bytes', 'error')
+
+    def __init__(self, stage, index=None):
+        self.stage = stage
+        self.index = index
+        self.seconds = 0.0
+        self.bytes = 0
+        self.error = False
+
+    def to_dict(self):
+        d = {"stage": self.stage, "seconds": round(self.seconds, 4), "bytes": self.bytes}
+        if self.index is not None:
+            d["index"] = self.index
+        if self.error:
+            d["error"] = True
+        return d
+
+def _record(span, trace):
+    REGISTRY.observe('jwmc_stage_seconds', span.seconds, stage=span.stage)
+    if span.bytes:
+        REGISTRY.inc('jwmc_stage_bytes_total', span.bytes, stage=span.stage)
+    if trace is not None:
+        trace._add(span)
+        trace.sample_memory()
+
+@contextmanager
+def span(stage, trace=None, index=None):
+    """Time the enclosed block as stage, in the registry and, if given, the job trace."""
+    current = Span(stage, index)
+    if trace is not None:
+        trace.sample_memory()
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        current.seconds = time.perf_counter() - start
+        _record(current, trace)
+
+def metered(chunks, stage, trace=None):
+    """
+    Pass chunks through, recording the time spent producing them and their total size as
+    stage. Used for streamed stages such as building the ZIP while it is uploaded.
+    """
+    current = Span(stage)
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            except BaseException:
+                current.error = True
+                raise
+            finally:
+                current.seconds += time.perf_counter() - start
+            current.bytes += len(chunk)
+            yield chunk
+    finally:
+        _record(current, trace)
+
+class JobTrace:
+    """
+    Collects the spans and cache lookups of one conversion job. finish() logs them as a
+    single JSON line, with per-stage totals and memory figures.
+
+    worker_rss_max_during_job_bytes is the largest resident size of the whole worker
+    sampled as the job's spans start and end: it includes jobs running alongside and can
+    miss peaks inside a span. The worker's lifetime peaks are reported separately.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.started = time.perf_counter()
+        self.spans = []
+        self.cache = {}
+        self.worker_rss_max = None
+        self._lock = threading.Lock()
+        self.sample_memory()
+
+    def sample_memory(self):
+        current = rss_bytes()
+        if current is None:
+            return
+        with self._lock:
+            if self.worker_rss_max is None or current > self.worker_rss_max:
+                self.worker_rss_max = current
+
+    def _add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def span(self, stage, index=None):
+        return span(stage, self, index)
+
+    def cache_lookup(self, cache, hit):
+        result = 'hit' if hit else 'miss'
+        REGISTRY.inc('jwmc_cache_requests_total', cache=cache, result=result)
+        with self._lock:
+            counts = self.cache.setdefault(cache, {'hit': 0, 'miss': 0})
+            counts[result] += 1
+
+    def summary(self, status):
+        self.sample_memory()
+        with self._lock:
+            spans = list(self.spans)
+            cache = {name: dict(counts) for name, counts in self.cache.items()}
+        stages = {}
+        for s in spans:
+            totals = stages.setdefault(s.stage, {"seconds": 0.0, "bytes": 0, "count": 0})
+            totals["seconds"] = round(totals["seconds"] + s.seconds, 4)
+            totals["bytes"] += s.bytes
+            totals["count"] += 1
+        peak, peak_children = peak_rss_bytes()
+        return {
+            "job_id": self.job_id,
+            "status": status,
+            "seconds": round(time.perf_counter() - self.started, 4),
+            "stages": stages,
+            "cache": cache,
+            "worker_rss_max_during_job_bytes": self.worker_rss_max,
+            "worker_peak_rss_bytes": peak,
+            "worker_peak_child_rss_bytes": peak_children,
+            "spans": [s.to_dict() for s in spans],
+        }
+
+    def finish(self, status):
+        summary = self.summary(status)
+        REGISTRY.inc('jwmc_jobs_total', status=status)
+        REGISTRY.observe('jwmc_job_seconds', summary["seconds"])
+        print(f"Job trace {json.dumps(summary, ensure_ascii=False)}")
+        return summary
@@ -0,0 +1,90 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+
+class ConversionPipeline:
+    """
+    Runs items through fetch -> cpu -> mux stages, each on its own bounded pool,
+    so one video can be muxing while the next is still downloading.
+
+    The pools are shared by every job in the process, which caps the total number
+    of concurrent downloads, subtitle conversions and mkvmerge subprocesses.
+    GIL-bound work in the cpu stage, such as pinyin generation, is handed to
+    run_in_process() and runs on cpu_workers worker processes.
+    """
+    def __init__(self, fetch_workers=4, cpu_workers=2, mux_workers=2):
+        self.fetch_pool = ThreadPoolExecutor(max_workers=fetch_workers, thread_name_prefix='fetch')
+        self.cpu_pool = ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix='cpu')
+        self.mux_pool = ThreadPoolExecutor(max_workers=mux_workers, thread_name_prefix='mux')
+        self.cpu_processes = cpu_workers
+        self._process_pool = None
+        self._process_pool_pid = None
+        self._process_lock = threading.Lock()
+
+    def run_in_process(self, fn, *args):
+        """
+        Run fn(*args) in a worker process and return its result. fn must be a module-level
+        function, and its arguments and result picklable.
+        """
+        return self._get_process_pool().submit(fn, *args).result()
+
+    def _get_process_pool(self):
+        # Created on first use in each process: a pool inherited through gunicorn's fork
+        # belongs to the master. Workers are spawned rather than forked from this
+        # multi-threaded process, and keep their loaded dictionaries between jobs.
+        with self._process_lock:
+            if self._process_pool is None or self._process_pool_pid != os.getpid():
+                self._process_pool = ProcessPoolExecutor(max_workers=self.cpu_processes,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+                self._process_pool_pid = os.getpid()
+            return self._process_pool
+
+    def run(self, items, fetch, cpu, mux):
+        """
+        Submit every item to the pipeline and return one future per item, in input order.
+        Each stage receives the previous stage's result; a failure skips the remaining stages.
+        """
+        futures = []
+        for item in items:
+            future = self.fetch_pool.submit(fetch, item)
+            future = self._then(future, self.cpu_pool, cpu)
+            future = self._then(future, self.mux_pool, mux)
+            futures.append(future)
+        return futures
+
+    def map(self, items, fetch, cpu, mux):
+        """Like run(), but wait and return (result, exception) pairs in input order."""
+        outcomes = []
+        for future in self.run(items, fetch, cpu, mux):
+            try:
+                outcomes.append((future.result(), None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
+
+    def shutdown(self, wait=True):
+        for pool in (self.fetch_pool, self.cpu_pool, self.mux_pool):
+            pool.shutdown(wait=wait)
+        if self._process_pool is not None and self._process_pool_pid == os.getpid():
+            self._process_pool.shutdown(wait=wait)
+
+    @staticmethod
+    def _then(future, pool, fn):
+        """Return a future for fn(future.result()) run on pool, once future completes."""
+        chained = Future()
+
+        def forward(source):
+            try:
+                chained.set_result(source.result())
+            except BaseException as e:
+                chained.set_exception(e)
+
+        def submit_next(source):
+            if source.exception() is not None:
+                chained.set_exception(source.exception())
+                return
+            pool.submit(fn, source.result()).add_done_callback(forward)
+
+        future.add_done_callback(submit_next)
+        return chained
@@ -0,0 +1,74 @@
+import re
+import bisect
+import unicodedata
+
+# Underscores split tokens too, so natural keys like 'pub-jwb_201_VIDEO' are searchable by part
+TOKEN_RE = re.compile(r'[^\W_]+')
+
+def normalize(text):
+    """Casefold and strip accents so 'Jéhovah' matches 'jehovah'."""
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+class SearchIndex:
+    """
+    In-process inverted index over catalog titles and natural keys.
+    Every query term is matched as a token prefix, and all terms must match.
+    """
+    def __init__(self, items):
+        # Documents are kept in title order, so a doc id is also its sort position
+        self.docs = sorted(items, key=lambda item: normalize(item.title))
+        # Slim projection returned for each hit; everything /download needs and nothing more
+        self.projections = [item.to_dict() for item in self.docs]
+
+        postings = {}
+        for doc_id, item in enumerate(self.docs):
+            tokens = set(tokenize(item.title))
+            tokens.update(tokenize(item.key or ''))
+            for token in tokens:
+                postings.setdefault(token, []).append(doc_id)
+
+        self.tokens = sorted(postings)
+        self.postings = [postings[t] for t in self.tokens]
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _prefix_matches(self, prefix):
+        """Return the set of doc ids having a token that starts with prefix."""
+        start = bisect.bisect_left(self.tokens, prefix)
+        end = bisect.bisect_left(self.tokens, prefix + '\U0010ffff', lo=start)
+        matches = set()
+        for i in range(start, end):
+            matches.update(self.postings[i])
+        return matches
+
+    def query(self, q):
+        """Return the sorted list of doc ids matching every term in q."""
+        terms = tokenize(q or '')
+        if not terms:
+            return range(len(self.docs))
+
+        # Narrow down with the longest (most selective) term first
+        result = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            matches = self._prefix_matches(term)
+            result = matches if result is None else result & matches
+            if not result:
+                return []
+        return sorted(result)
+
+    def search(self, q, limit=20, cursor=0):
+        """
+        Return one page of results as {"items", "total", "next_cursor"}.
+        The cursor is the offset of the next page, or None on the last page.
+        """
+        doc_ids = self.query(q)
+        total = len(doc_ids)
+        page = doc_ids[cursor:cursor + limit]
+        items = [{"title": self.docs[i].title, "data": self.projections[i]} for i in page]
+        next_cursor = cursor + limit if cursor + limit < total else None
+        return {"items": items, "total": total, "next_cursor": next_cursor}
@@ -1,10 +1,26 @@
 import os
 import io
 import re
+import tempfile
 import jieba
+from functools import lru_cache
 from pypinyin import lazy_pinyin, Style, pinyin
 import logging
-import tempfile
+
+# Word -> pinyin entries kept across files; JW subtitles reuse a lot of vocabulary
+PINYIN_CACHE_SIZE = int(os.getenv('PINYIN_CACHE_SIZE', '50000'))
+
+CUE_NUMBER_RE = re.compile(r'^\d+$\n')
+
+# jieba serializes its prefix dictionary here the first time it is built, so later
+# processes on the host load it instead of rebuilding it
+JIEBA_CACHE_DIR = os.getenv('JIEBA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'jwmediaconverter', 'jieba'))
+os.makedirs(JIEBA_CACHE_DIR, exist_ok=True)
+jieba.dt.tmp_dir = JIEBA_CACHE_DIR
+
+@lru_cache(maxsize=PINYIN_CACHE_SIZE)
+def word_pinyin(word):
+    return "".join(lazy_pinyin(word, style=Style.TONE, v_to_u=True, strict=False))
 
 class SubtitleProcessor:
     def __init__(self):
@@ -23,17 +39,15 @@ class SubtitleProcessor:
         return word_list
 
     def pinyin_lize(self, word_list, sentStyle=True):
-        pinyin_list = []
-        for word in word_list:
-            pinyin_list.append("".join(lazy_pinyin(word, style=Style.TONE, v_to_u=True, strict=False)))
-        
+        pinyin_list = [word_pinyin(word) for word in word_list]
+
         if sentStyle:
             pinyin_string = ' '.join(pinyin_list)
             final_result = pinyin_string.capitalize()
         else:
             pinyin_list = [pinyin.capitalize() for pinyin in pinyin_list]
             final_result = ' '.join(pinyin_list)
-        
+
         return final_result
 
     def to_pinyin(self, text, sent_style=True):
@@ -49,27 +63,57 @@ class SubtitleProcessor:
         segmented_text = ' '.join(words)
         return pinyin_words, segmented_text
 
+    def pinyin_lines(self, lines, sent_style=True):
+        """
+        Convert a batch of subtitle text lines in one pass.
+        Each distinct line is segmented once, and the segmentation is used for both the
+        pinyin and the spaced Chinese text. Returns a list of (pinyin, segmented) pairs.
+        """
+        results = {}
+        for line in lines:
+            if line not in results:
+                words = jieba.lcut(self.process_text(line))
+                results[line] = (self.pinyin_lize(words, sentStyle=sent_style), ' '.join(words))
+        return [results[line] for line in lines]
+
+    def pinyin_cues(self, cues):
+        """
+        Build the pinyin track from parsed subtitle cues (see vtt.parse_vtt): every line
+        of a cue becomes its pinyin followed by the segmented Chinese, in the same cue.
+        """
+        converted = iter(self.pinyin_lines([line for cue in cues for line in cue.lines]))
+        pinyin_cues = []
+        for cue in cues:
+            lines = []
+            for _ in cue.lines:
+                lines.extend(next(converted))
+            pinyin_cues.append(cue._replace(lines=lines))
+        return pinyin_cues
+
     def generate_pinyin_subtitle_file(self, filepath, destination):
         # Open and read the input SRT file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".srt") as temp_srt:
-            with open(filepath, 'r', encoding='utf-8') as vtt_file:
-                lines = vtt_file.readlines()
-
-            new_lines = []
-
-            # Process each line in the SRT file
-            for line in lines:
-                match = re.match(r'^\d+$\n', line)
-                if match or '-->' in line or line.strip() == '':
-                    new_lines.append(line)
-                else:
-                    # Get pinyin conversion using the refactored to_pinyin method
-                    pinyin_output = self.to_pinyin(line.strip(), sent_style=True)
-                    # Get segmented Chinese text
-                    segmented_text = ' '.join(jieba.lcut(line.strip()))
-                    new_lines.append(pinyin_output + '\n')
-                    new_lines.append(segmented_text + '\n')
-                    new_lines.append('\n')  # Optional: Add an empty line to separate segments neatly
-
-            with open(destination, 'w', encoding='utf-8') as file:
-                file.writelines(new_lines)
\ No newline at end of file
+        with open(filepath, 'r', encoding='utf-8') as srt_file:
+            lines = srt_file.readlines()
+
+        # Convert every text line of every cue in one batch
+        is_text = [not (CUE_NUMBER_RE.match(line) or '-->' in line or line.strip() == '') for line in lines]
+        converted = iter(self.pinyin_lines([line.strip() for line, text in zip(lines, is_text) if text]))
+
+        new_lines = []
+
+        # Process each line in the SRT file
+        for line, text in zip(lines, is_text):
+            if not text:
+                new_lines.append(line)
+            else:
+                pinyin_output, segmented_text = next(converted)
+                new_lines.append(pinyin_output + '\n')
+                new_lines.append(segmented_text + '\n')
+                new_lines.append('\n')  # Optional: Add an empty line to separate segments neatly
+
+        with open(destination, 'w', encoding='utf-8') as file:
+            file.writelines(new_lines)
+
+def pinyin_cues(cues):
+    """SubtitleProcessor().pinyin_cues(cues) as a module-level function, to run in a worker process."""
+    return SubtitleProcessor().pinyin_cues(cues)
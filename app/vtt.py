@@ -0,0 +1,64 @@
+import re
+import html
+from collections import namedtuple
+
+# start and end are SRT timestamps (00:01:02,345); lines is the cue text, one entry per line
+Cue = namedtuple('Cue', ['start', 'end', 'lines'])
+
+# VTT allows the hours to be omitted (mm:ss.ttt) or to have more than two digits
+TIMESTAMP = r'(?:(\d{2,}):)?(\d{2}):(\d{2})[.,](\d{3})'
+
+# A timing line (its cue settings ignored) and the text lines after it, up to a blank line
+# or the next timing line. Cue identifiers and NOTE/STYLE/REGION blocks never contain
+# "-->", so they are skipped
+CUE_RE = re.compile(r'^[ \t]*' + TIMESTAMP + r'[ \t]+-->[ \t]+' + TIMESTAMP + r'(?:[ \t][^\n]*)?\n((?:(?![^\n]*-->)[ \t]*\S[^\n]*\n?)*)', re.M)
+
+# Any tag: <c.yellow>, <v Speaker>, <00:00:01.000>, <ruby>, </i>...
+TAG_RE = re.compile(r'<(/?)([^>\s./]*)[^>]*>')
+SRT_TAGS = {'i', 'b', 'u'}
+
+def _srt_tag(m):
+    # Keep the formatting SRT understands, without VTT classes (<i.loud> -> <i>)
+    name = m.group(2)
+    return f"<{m.group(1)}{name}>" if name in SRT_TAGS else ''
+
+def _clean(text):
+    if '<' in text:
+        text = TAG_RE.sub(_srt_tag, text)
+    if '&' in text:
+        text = html.unescape(text)
+    return [line for line in map(str.strip, text.split('\n')) if line]
+
+def iter_cues(text):
+    """
+    Parse WebVTT text into Cues in a single regex scan.
+    Cue identifiers and settings, NOTE/STYLE/REGION blocks and tags SRT can't show are
+    dropped; multi-line cues keep their lines. Cues without text are skipped.
+    """
+    for m in CUE_RE.finditer(text):
+        h1, m1, s1, ms1, h2, m2, s2, ms2, body = m.groups()
+        lines = _clean(body)
+        if lines:
+            yield Cue(f"{h1.zfill(2) if h1 else '00'}:{m1}:{s1},{ms1}",
+                      f"{h2.zfill(2) if h2 else '00'}:{m2}:{s2},{ms2}", lines)
+
+def parse_vtt(data):
+    """Parse the bytes of a WebVTT file into a list of Cues."""
+    text = data.decode('utf-8-sig')
+    # VTT line terminators are CRLF, LF or CR
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return list(iter_cues(text))
+
+def format_srt(cues):
+    """Return the bytes of an SRT file holding cues, numbered from 1."""
+    parts = []
+    for number, cue in enumerate(cues, 1):
+        parts.append(f"{number}\n{cue.start} --> {cue.end}\n")
+        parts.append('\n'.join(cue.lines))
+        parts.append('\n\n')
+    return ''.join(parts).encode('utf-8')
+
+def vtt_to_srt(data):
+    """Convert the bytes of a WebVTT file to the bytes of an SRT file."""
+    return format_srt(parse_vtt(data))
@@ -0,0 +1,46 @@
+import os
+import time
+import threading
+
+# Seconds spent in each startup phase of this process, e.g. app import, warmup, first request
+STARTUP_TIMINGS = {}
+
+_warm = False
+_lock = threading.Lock()
+
+def record(phase, seconds):
+    STARTUP_TIMINGS[phase] = round(seconds, 4)
+    print(f"Startup [{os.getpid()}]: {phase} took {seconds:.3f}s")
+
+def warm_up():
+    """
+    Load the jieba and pypinyin dictionaries and the muxing libraries up front.
+
+    jieba's prefix dictionary is loaded from the host-wide cache in JIEBA_CACHE_DIR.
+    Called in the gunicorn master before forking (see gunicorn.conf.py), the loaded
+    dictionaries are shared copy-on-write by every worker, so the first conversion in
+    a worker no longer pays the load time.
+    """
+    global _warm
+    with _lock:
+        if _warm:
+            return
+        start = time.perf_counter()
+
+        import jieba
+        from subtitle_processor import SubtitleProcessor
+        jieba.initialize()
+        record('jieba_dictionary', time.perf_counter() - start)
+
+        phase_start = time.perf_counter()
+        # Loads pypinyin's phrase dictionaries
+        SubtitleProcessor().to_pinyin("中文字幕")
+        record('pypinyin_dictionary', time.perf_counter() - phase_start)
+
+        phase_start = time.perf_counter()
+        import pymkv
+        import azure.storage.blob
+        record('mux_and_storage_imports', time.perf_counter() - phase_start)
+
+        record('warmup', time.perf_counter() - start)
+        _warm = True
@@ -0,0 +1,183 @@
+import os
+import json
+import uuid
+import atexit
+import shutil
+import socket
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; reservations are then per process only
+    fcntl = None
+
+OWNER_FILE = '.owner'
+
+class QuotaExceeded(Exception):
+    pass
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _disk_usage(path):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+class Workspace:
+    """A private scratch directory for one job."""
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+        self.reserved = 0
+
+    def subdir(self, name):
+        path = os.path.join(self.path, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def reserve(self, nbytes):
+        """Claim nbytes of scratch space, raising QuotaExceeded if it isn't available."""
+        self.manager._reserve(self, nbytes)
+
+    def usage(self):
+        return _disk_usage(self.path)
+
+    def true_up(self):
+        """
+        Reserve whatever the workspace uses on disk beyond its reservation, raising
+        QuotaExceeded if that doesn't fit. Call after stages that write files whose size
+        wasn't known when the space was reserved.
+        """
+        extra = self.usage() - self.reserved
+        if extra > 0:
+            self.reserve(extra)
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manager._forget(self)
+
+class WorkspaceManager:
+    """
+    Hands out a unique scratch directory per job under root, so concurrent conversions
+    in any worker never share files.
+
+    Jobs reserve the space they expect to use before downloading, and true up the
+    reservation to the space actually used after each stage. A reservation fails
+    with QuotaExceeded if the job would exceed quota_bytes, or if all live workspaces
+    on the host together would exceed total_bytes (0 means no limit); reservations of
+    processes that have died don't count.
+    Workspaces are removed when the job ends or the process exits. Directories left
+    behind by a process that crashed are swept when a manager starts, and again every
+    sweep_interval seconds as jobs create workspaces.
+    """
+    def __init__(self, root, quota_bytes=0, total_bytes=0, sweep_interval=600):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.total_bytes = total_bytes
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0
+        self.host = socket.gethostname()
+        self._live = set()
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.sweep()
+        atexit.register(self._cleanup_all)
+
+    def create(self, label='job'):
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self.sweep()
+        path = os.path.join(self.root, f"{label}-{os.getpid()}-{uuid.uuid4().hex[:12]}")
+        os.makedirs(path)
+        workspace = Workspace(self, path)
+        self._write_owner(workspace)
+        with self._lock:
+            self._live.add(workspace)
+        return workspace
+
+    def sweep(self):
+        """Remove workspaces whose owning process on this host no longer exists."""
+        self._last_sweep = time.monotonic()
+        for entry in os.scandir(self.root):
+            if not entry.is_dir():
+                continue
+            owner = self._read_owner(entry.path)
+            if owner is None:
+                # Either being created right now or left half-made by a crash
+                abandoned = time.time() - entry.stat().st_mtime > 3600
+            else:
+                abandoned = self._owner_dead(owner)
+            if abandoned:
+                print(f"Removing abandoned workspace {entry.path}")
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def _owner_dead(self, owner):
+        return owner.get('host') == self.host and not _pid_alive(owner.get('pid', 0))
+
+    def _read_owner(self, path):
+        try:
+            with open(os.path.join(path, OWNER_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_owner(self, workspace):
+        tmp_path = os.path.join(workspace.path, OWNER_FILE + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"pid": os.getpid(), "host": self.host, "reserved": workspace.reserved}, f)
+        os.replace(tmp_path, os.path.join(workspace.path, OWNER_FILE))
+
+    @contextmanager
+    def _root_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.root, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reserve(self, workspace, nbytes):
+        with self._root_lock():
+            if self.quota_bytes and workspace.reserved + nbytes > self.quota_bytes:
+                raise QuotaExceeded(f"Job needs {workspace.reserved + nbytes} bytes of scratch space, quota is {self.quota_bytes}")
+            if self.total_bytes:
+                in_use = 0
+                for entry in os.scandir(self.root):
+                    owner = self._read_owner(entry.path) if entry.is_dir() else None
+                    if not owner:
+                        continue
+                    if self._owner_dead(owner):
+                        # Left by a worker that was killed; its space is free again
+                        print(f"Removing abandoned workspace {entry.path}")
+                        shutil.rmtree(entry.path, ignore_errors=True)
+                        continue
+                    in_use += owner.get('reserved', 0)
+                if in_use + nbytes > self.total_bytes:
+                    raise QuotaExceeded(f"Scratch volume is full ({in_use} of {self.total_bytes} bytes reserved)")
+            workspace.reserved += nbytes
+            self._write_owner(workspace)
+
+    def _forget(self, workspace):
+        with self._lock:
+            self._live.discard(workspace)
+
+    def _cleanup_all(self):
+        for workspace in list(self._live):
+            workspace.cleanup()
@@ -0,0 +1,115 @@
+"""
+Benchmark the streaming catalog parser against the original buffered
+fetch_and_decompress_gz, using a generated catalog served from localhost.
+
+    python benchmarks/bench_catalog.py --items 200000
+"""
+import os
+import io
+import sys
+import gzip
+import json
+import time
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import functools
+import requests
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from catalog_parser import stream_catalog
+
+def legacy_fetch_and_decompress_gz(gz_url):
+    """fetch_and_decompress_gz as it was before the streaming parser."""
+    response = requests.get(gz_url, stream=True)
+    if response.status_code == 200:
+        gz_data = io.BytesIO(response.content)
+        with gzip.GzipFile(fileobj=gz_data, mode='rb') as f:
+            extracted_titles = []
+            for line in f:
+                try:
+                    json_obj = json.loads(line.decode('utf-8'))
+                    o = json_obj.get('o', {})
+                    if json_obj['type'] == 'media-item' and o.get('keyParts', {}).get('formatCode') == 'VIDEO':
+                        extracted_titles.append(o)
+                except json.JSONDecodeError:
+                    continue
+            return extracted_titles
+    else:
+        raise Exception(f"Failed to download gz file from {gz_url}")
+
+def streaming_fetch(gz_url):
+    return list(stream_catalog(gz_url))
+
+def write_catalog(path, items):
+    """Write a catalog shaped like E.json.gz: videos, audio and category lines mixed together."""
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for i in range(items):
+            kind = 'VIDEO' if i % 2 == 0 else 'AUDIO'
+            f.write(json.dumps({
+                "type": "media-item",
+                "o": {
+                    "title": f"Sample media item number {i}",
+                    "languageAgnosticNaturalKey": f"pub-sample_{i}_{kind}",
+                    "naturalKey": f"pub-sample_{i}_E_{kind}",
+                    "keyParts": {"pubSymbol": "sample", "track": i, "formatCode": kind},
+                    "duration": 120.5,
+                    "firstPublished": "2020-01-01T00:00:00.000Z",
+                    "images": {"lss": {"lg": f"https://example.invalid/{i}_lss_lg.jpg"}},
+                    "description": "Lorem ipsum dolor sit amet " * 8,
+                },
+            }) + '\n')
+            if i % 50 == 0:
+                f.write(json.dumps({"type": "category", "o": {"key": f"Category{i}", "media": []}}) + '\n')
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def serve(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def measure(fn, url, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = len(fn(url))
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, min(times), peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=100000, help='media items in the generated catalog')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per variant (best is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_catalog(os.path.join(tmp, 'E.json.gz'), args.items)
+        server = serve(tmp)
+        url = f"http://127.0.0.1:{server.server_address[1]}/E.json.gz"
+        size_mb = os.path.getsize(os.path.join(tmp, 'E.json.gz')) / 1e6
+        print(f"Catalog: {args.items} items, {size_mb:.1f} MB compressed")
+
+        results = {}
+        for name, fn in [('legacy', legacy_fetch_and_decompress_gz), ('streaming', streaming_fetch)]:
+            count, best, peak = measure(fn, url, args.repeat)
+            results[name] = (best, peak)
+            print(f"{name:>10}: {count} videos, {best * 1000:8.1f} ms, peak {peak / 1e6:8.1f} MB")
+        server.shutdown()
+
+    (legacy_time, legacy_peak), (stream_time, stream_peak) = results['legacy'], results['streaming']
+    print(f"Speedup {legacy_time / stream_time:.2f}x, peak memory {legacy_peak / stream_peak:.2f}x lower")
+
+if __name__ == '__main__':
+    main()
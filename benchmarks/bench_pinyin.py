@@ -0,0 +1,96 @@
+"""
+Benchmark pinyin subtitle generation against the original per-line implementation,
+using a generated long Chinese SRT file.
+
+    python benchmarks/bench_pinyin.py --cues 2000
+"""
+import os
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import jieba
+from pypinyin import lazy_pinyin, Style
+from subtitle_processor import SubtitleProcessor, word_pinyin
+
+PHRASES = [
+    "耶和华是我们的上帝", "圣经说", "我们应该怎样做", "你可以在家里学习圣经", "上帝的王国会带来和平",
+    "我们一起来看看", "这段经文告诉我们什么", "家庭生活会更快乐", "年轻人可以怎样做", "真正的朋友",
+    "请看看这个例子", "我们会永远活在地上", "祷告的时候", "耶稣说过", "让我们想想",
+]
+
+def legacy_generate_pinyin_subtitle_file(filepath, destination):
+    """generate_pinyin_subtitle_file as it was before the batched engine."""
+    processor = SubtitleProcessor()
+
+    def to_pinyin(text):
+        words = jieba.cut(processor.process_text(text), use_paddle=False, cut_all=False)
+        pinyin_list = ["".join(lazy_pinyin(word, style=Style.TONE, v_to_u=True, strict=False)) for word in words]
+        return ' '.join(pinyin_list).capitalize()
+
+    with open(filepath, 'r', encoding='utf-8') as srt_file:
+        lines = srt_file.readlines()
+    new_lines = []
+    for line in lines:
+        if re.match(r'^\d+$\n', line) or '-->' in line or line.strip() == '':
+            new_lines.append(line)
+        else:
+            new_lines.append(to_pinyin(line.strip()) + '\n')
+            new_lines.append(' '.join(jieba.lcut(line.strip())) + '\n')
+            new_lines.append('\n')
+    with open(destination, 'w', encoding='utf-8') as file:
+        file.writelines(new_lines)
+
+def write_srt(path, cues, seed=1):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(cues):
+            start, end = i * 3, i * 3 + 2
+            f.write(f"{i + 1}\n00:{start // 60 % 60:02d}:{start % 60:02d},000 --> 00:{end // 60 % 60:02d}:{end % 60:02d},000\n")
+            f.write("，".join(rng.sample(PHRASES, rng.randint(2, 4))) + "。\n")
+            if i % 3 == 0:
+                f.write(rng.choice(PHRASES) + "？\n")
+            f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cues', type=int, default=2000, help='cues in the generated subtitle file')
+    args = parser.parse_args()
+
+    jieba.setLogLevel(60)
+    jieba.initialize()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'chs.srt')
+        write_srt(source, args.cues)
+        legacy_out, batched_out = os.path.join(tmp, 'legacy.srt'), os.path.join(tmp, 'batched.srt')
+
+        start = time.perf_counter()
+        legacy_generate_pinyin_subtitle_file(source, legacy_out)
+        legacy_time = time.perf_counter() - start
+
+        word_pinyin.cache_clear()
+        start = time.perf_counter()
+        SubtitleProcessor().generate_pinyin_subtitle_file(source, batched_out)
+        cold_time = time.perf_counter() - start
+
+        # Second file with a warm word cache, as for the next job in the same worker
+        start = time.perf_counter()
+        SubtitleProcessor().generate_pinyin_subtitle_file(source, batched_out)
+        warm_time = time.perf_counter() - start
+
+        with open(legacy_out, encoding='utf-8') as a, open(batched_out, encoding='utf-8') as b:
+            identical = a.read() == b.read()
+
+    print(f"Cues: {args.cues}, output identical: {identical}")
+    print(f"    legacy: {legacy_time * 1000:8.1f} ms")
+    print(f"   batched: {cold_time * 1000:8.1f} ms cold cache ({legacy_time / cold_time:.1f}x), "
+          f"{warm_time * 1000:8.1f} ms warm cache ({legacy_time / warm_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark VTT -> SRT conversion against the original regex/temp file implementation,
+using a generated subtitle file.
+
+    python benchmarks/bench_vtt.py --cues 5000
+"""
+import os
+import io
+import re
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from vtt import vtt_to_srt
+
+PHRASES = [
+    "耶和华是我们的上帝", "圣经说", "我们应该怎样做", "你可以在家里学习圣经", "上帝的王国会带来和平",
+    "What does the Bible say?", "Let's find out", "A happy family life", "True friends",
+]
+
+def legacy_convert_vtt_to_temp_srt(vtt_filepath):
+    """convert_vtt_to_temp_srt as it was before vtt.py."""
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".vtt") as temp_srt:
+        with open(vtt_filepath, 'r', encoding='utf-8') as vtt_file:
+            vtt_content = vtt_file.read()
+        srt_content = re.sub(r'WEBVTT\s*\n', '', vtt_content)
+        srt_content = re.sub(r'(\d+:\d+:\d+)\.(\d+)', r'\1,\2', srt_content)
+        srt_content = re.sub(r'(\d{2}:\d{2}:\d{2},\d{3} --> \d{2}:\d{2}:\d{2},\d{3}).*', r'\1', srt_content)
+        srt_blocks = srt_content.strip().split('\n\n')
+        srt_content_with_numbers = ""
+        for i, block in enumerate(srt_blocks):
+            srt_content_with_numbers += f"{i + 1}\n{block.strip()}\n\n"
+        temp_srt.write(srt_content_with_numbers.encode('utf-8'))
+        temp_srt.flush()
+        temp_srt.seek(0)
+        srt_bytes = io.BytesIO(temp_srt.read())
+    os.remove(temp_srt.name)
+    return srt_bytes
+
+def write_vtt(path, cues, seed=1):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\n\n")
+        for i in range(cues):
+            start, end = i * 3, i * 3 + 2
+            f.write(f"{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d}.000 --> "
+                    f"{end // 3600:02d}:{end // 60 % 60:02d}:{end % 60:02d}.000 line:85% align:center\n")
+            for _ in range(rng.randint(1, 2)):
+                f.write(rng.choice(PHRASES) + "\n")
+            f.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cues', type=int, default=5000, help='cues in the generated subtitle file')
+    parser.add_argument('--repeat', type=int, default=5, help='conversions per implementation')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'subtitles.vtt')
+        write_vtt(source, args.cues)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            legacy = legacy_convert_vtt_to_temp_srt(source).getvalue()
+        legacy_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            with open(source, 'rb') as f:
+                converted = vtt_to_srt(f.read())
+        new_time = (time.perf_counter() - start) / args.repeat
+
+    print(f"Cues: {args.cues}, output identical: {legacy == converted}")
+    print(f"    legacy: {legacy_time * 1000:8.1f} ms")
+    print(f"       vtt: {new_time * 1000:8.1f} ms ({legacy_time / new_time:.1f}x)")
+
+if __name__ == '__main__':
+    main()
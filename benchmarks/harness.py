@@ -0,0 +1,147 @@
+"""
+Offline stand-ins for the services the converter talks to, used by run_suite.py:
+a fixture tree served over local HTTP in place of the jw-cdn catalog, mediator API and
+CDN, and an in-process replacement for the Azure blob container.
+"""
+import os
+import json
+import shutil
+import random
+import functools
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer
+
+from bench_catalog import QuietHandler, write_catalog
+from bench_vtt import PHRASES
+
+def write_vtt(path, language, cues, seed=1):
+    """Write a WebVTT file of varied one- and two-line cues; Chinese text for CHS/CH."""
+    # Imported here: bench_pinyin loads subtitle_processor, which reads JIEBA_CACHE_DIR on import,
+    # so it must come after run_suite has configured the environment
+    from bench_pinyin import PHRASES as CHINESE_PHRASES
+    rng = random.Random(seed)
+    phrases, separator = (CHINESE_PHRASES, "，") if language in ('CHS', 'CH') else (PHRASES, " ")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("WEBVTT\n\n")
+        for i in range(cues):
+            start, end = i * 3, i * 3 + 2
+            f.write(f"{i + 1}\n{start // 3600:02d}:{start // 60 % 60:02d}:{start % 60:02d}.000 --> "
+                    f"{end // 3600:02d}:{end // 60 % 60:02d}:{end % 60:02d}.000 line:85%\n")
+            for _ in range(rng.randint(1, 2)):
+                f.write(separator.join(rng.sample(phrases, rng.randint(1, 3))) + "\n")
+            f.write("\n")
+
+def write_mp4(path, seconds, size, seed=1):
+    """
+    Write a test MP4 of the given length with ffmpeg (picture plus a tone), or, without ffmpeg,
+    a file of size random bytes that can be downloaded and zipped but not muxed.
+    Returns True if a real MP4 was written.
+    """
+    if shutil.which('ffmpeg'):
+        subprocess.run(['ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+                        '-f', 'lavfi', '-i', f'testsrc=size=640x360:rate=25:duration={seconds}',
+                        '-f', 'lavfi', '-i', f'sine=frequency={220 + seed * 110}:duration={seconds}',
+                        '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', '-shortest', path],
+                       check=True)
+        return True
+    rng = random.Random(seed)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            block = min(remaining, 1024 * 1024)
+            f.write(rng.randbytes(block))
+            remaining -= block
+    return False
+
+class Fixtures:
+    """
+    Builds the fixture tree under root:
+
+        catalogs/media/E.json.gz               catalog
+        mediator/<LANG>/<key>                  mediator responses
+        cdn/<LANG>_<r>p.mp4, cdn/<LANG>.vtt    renditions and subtitles, shared by all videos
+    """
+    def __init__(self, root, videos=3, languages=('E', 'CHS'), catalog_items=20000,
+                 video_seconds=30, video_bytes=8 * 1024 * 1024, cues=600):
+        self.root = root
+        self.keys = [f"pub-bench_{i}_VIDEO" for i in range(videos)]
+        self.languages = list(languages)
+        self.catalog_items = catalog_items
+        self.video_seconds = video_seconds
+        self.video_bytes = video_bytes
+        self.cues = cues
+        self.real_media = False
+
+    def build(self, base_url):
+        """Write every fixture; URLs inside the mediator responses point at base_url."""
+        write_catalog(self._path('catalogs', 'media', 'E.json.gz'), self.catalog_items)
+
+        # Two renditions per language, shared by every video so generation stays quick
+        renditions = {}
+        for seed, language in enumerate(self.languages, 1):
+            for label, scale in (('720', 1.0), ('240', 0.3)):
+                name = f"{language}_{label}p.mp4"
+                self.real_media = write_mp4(self._path('cdn', name), self.video_seconds,
+                                            int(self.video_bytes * scale), seed)
+                renditions[(language, label)] = name
+            write_vtt(self._path('cdn', f"{language}.vtt"), language, self.cues, seed)
+
+        for key in self.keys:
+            for language in self.languages:
+                files = []
+                for label in ('720', '240'):
+                    name = renditions[(language, label)]
+                    files.append({
+                        "label": f"{label}p",
+                        "progressiveDownloadURL": f"{base_url}/cdn/{name}?{key}",
+                        "filesize": os.path.getsize(self._path('cdn', name)),
+                        "checksum": f"{key}-{name}",
+                        "subtitles": {"url": f"{base_url}/cdn/{language}.vtt?{key}", "checksum": f"{key}-{language}-vtt"},
+                    })
+                with open(self._path('mediator', language, key), 'w', encoding='utf-8') as f:
+                    json.dump({"media": [{"title": f"Benchmark video {key} ({language})", "files": files}]}, f)
+        return self
+
+    def _path(self, *parts):
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+class FixtureServer:
+    """Serves a fixture tree on an ephemeral localhost port; query strings are ignored."""
+    def __init__(self, root):
+        handler = functools.partial(QuietHandler, directory=root)
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class LocalBlobClient:
+    """Implements the part of azure.storage.blob.BlobClient that BlockUploader uses, on local disk."""
+    def __init__(self, root, name):
+        self.path = os.path.join(root, name)
+        self.url = f"file://{self.path}"
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def stage_block(self, block_id, data, length=None):
+        with self._lock:
+            self._blocks[block_id] = bytes(data)
+
+    def commit_block_list(self, block_list, content_settings=None):
+        with open(self.path, 'wb') as f:
+            for block in block_list:
+                f.write(self._blocks.pop(block.id))
+
+class LocalContainerClient:
+    """Stands in for the container client returned by main.get_container_client()."""
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def get_blob_client(self, name):
+        return LocalBlobClient(self.root, name)
@@ -0,0 +1,354 @@
+"""
+Offline benchmark suite for the conversion pipeline.
+
+Generates a catalog, mediator responses, MP4 renditions and VTT subtitles, serves them
+from localhost and uploads to a local blob stand-in, so no network is needed. Every
+stage, and whole jobs end to end, is timed over several runs and reported as latency
+percentiles, throughput and peak Python heap (tracemalloc, in a separate run). Stages
+that start subprocesses (mkvmerge, ffmpeg) also report the peak total resident memory of
+the subprocesses the run started, sampled from /proc. Pinyin worker processes already
+running from earlier runs aren't counted.
+
+    python benchmarks/run_suite.py
+    python benchmarks/run_suite.py --save benchmarks/baseline.json
+    python benchmarks/run_suite.py --compare benchmarks/baseline.json
+
+With --compare the exit status is 1 if any stage's median latency or peak memory regressed
+by more than --tolerance, and 2 if the baseline was recorded with other options or tools.
+Baselines depend on the machine; save one on the machine that runs the comparison. Muxing and the end-to-end job need ffmpeg (and mkvmerge for the
+default mux mode); without them those stages are skipped and the MP4s are random bytes.
+
+The mux mode is the app's default, mkvmerge, when it is installed and stream otherwise;
+--mux-mode picks one. The committed baseline.json was recorded in stream mode, so on a
+host with mkvmerge compare against it with --mux-mode stream, or save a mkvmerge baseline.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from harness import Fixtures, FixtureServer, LocalContainerClient
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+def descendants_rss(exclude=()):
+    """
+    Return {pid: resident bytes} for this process's descendants, from /proc, leaving out
+    the pids in exclude (but not their descendants).
+    """
+    parents = {}
+    for name in os.listdir('/proc'):
+        if name.isdigit():
+            try:
+                with open(f'/proc/{name}/stat') as f:
+                    # The command name may contain spaces; the parent pid follows it and the state
+                    parents.setdefault(int(f.read().rsplit(')', 1)[1].split()[1]), []).append(int(name))
+            except (OSError, IndexError, ValueError):
+                pass
+    rss = {}
+    pending = list(parents.get(os.getpid(), []))
+    while pending:
+        pid = pending.pop()
+        pending.extend(parents.get(pid, []))
+        if pid in exclude:
+            continue
+        try:
+            with open(f'/proc/{pid}/statm') as f:
+                rss[pid] = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, IndexError, ValueError):
+            pass
+    return rss
+
+class ChildMemorySampler:
+    """
+    Samples the total resident memory of the descendants started after __enter__ every
+    interval seconds on a thread, and keeps the peak.
+
+    getrusage(RUSAGE_CHILDREN) isn't used: a child's ru_maxrss includes the parent's
+    memory at the fork before exec, and pool workers that haven't exited aren't counted.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._existing = set()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, sum(descendants_rss(self._existing).values()))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self._existing = set(descendants_rss())
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+def measure(fn, repeat, setup=None, subprocesses=False):
+    """
+    Run fn() repeat times and return (latencies, work, peak heap bytes, peak subprocess
+    resident bytes). fn returns the amount of work it did (bytes or items); setup, if
+    given, runs untimed before each call. Subprocess memory is None unless subprocesses
+    is set and /proc is available.
+    """
+    latencies = []
+    work = 0
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        work = fn()
+        latencies.append(time.perf_counter() - start)
+
+    if setup:
+        setup()
+    sampler = ChildMemorySampler() if subprocesses and os.path.isdir('/proc') else None
+    tracemalloc.start()
+    try:
+        if sampler:
+            with sampler:
+                fn()
+        else:
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return latencies, work, peak, sampler.peak if sampler else None
+
+def summarize(latencies, work, unit, peak, children=None):
+    p50 = percentile(latencies, 0.5)
+    result = {
+        "runs": len(latencies),
+        "p50_ms": round(p50 * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.9) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "throughput": round(work / p50, 1) if p50 else None,
+        "unit": f"{unit}/s",
+        "peak_mb": round(peak / 1e6, 2),
+    }
+    if children is not None:
+        result["children_peak_mb"] = round(children / 1e6, 2)
+    return result
+
+def configure_environment(work_dir, base_url, mux_mode):
+    """Point the app at the fixtures; must run before any app module is imported."""
+    os.environ.update({
+        'CATALOG_URL': f"{base_url}/catalogs/media/E.json.gz",
+        'MEDIATOR_URL': f"{base_url}/mediator",
+        'BLOB_CONNECTION_STRING': 'UseDevelopmentStorage=true',
+        'DEFER_BACKGROUND_START': '1',
+        'JOBS_DB': os.path.join(work_dir, 'jobs.sqlite3'),
+        'SCRATCH_DIR': os.path.join(work_dir, 'scratch'),
+        'CATALOG_CACHE_DIR': os.path.join(work_dir, 'catalog'),
+        'JIEBA_CACHE_DIR': os.path.join(work_dir, 'jieba'),
+        'MEDIA_CACHE_DIR': os.path.join(work_dir, 'media'),
+        'RESULT_CACHE_DIR': os.path.join(work_dir, 'results'),
+        # Every run does the full work instead of hitting a cache filled by the previous one
+        'MEDIA_CACHE_MAX_BYTES': '0',
+        'RESULT_CACHE_MAX_BYTES': '0',
+        'MUX_MODE': mux_mode or 'mkvmerge',
+    })
+
+def run_stages(fixtures, base_url, work_dir, repeat, mux_mode):
+    import main
+    import jieba
+    from catalog_parser import stream_catalog
+    from mediator import MediatorClient
+    from vtt import vtt_to_srt, parse_vtt
+    from subtitle_processor import SubtitleProcessor, word_pinyin
+    from archive import iter_zip
+    from blob_upload import BlockUploader
+
+    jieba.setLogLevel(60)
+    jieba.initialize()
+    results = {}
+
+    def stage(name, fn, unit, setup=None, subprocesses=False):
+        latencies, work, peak, children = measure(fn, repeat, setup, subprocesses)
+        results[name] = summarize(latencies, work, unit, peak, children)
+        r = results[name]
+        print(f"{name:>12}: p50 {r['p50_ms']:9.1f} ms  p90 {r['p90_ms']:9.1f} ms  "
+              f"{r['throughput'] or 0:12.1f} {r['unit']:<8}  peak {r['peak_mb']:8.1f} MB"
+              + (f"  children {r['children_peak_mb']:8.1f} MB" if 'children_peak_mb' in r else ''))
+
+    def skipped(name, reason):
+        print(f"{name:>12}: skipped ({reason})")
+
+    catalog_url = f"{base_url}/catalogs/media/E.json.gz"
+    stage('catalog', lambda: len(list(stream_catalog(catalog_url))), 'videos')
+
+    stage('mediator', lambda: len(MediatorClient(f"{base_url}/mediator", ttl=0)
+                                  .media_items(fixtures.keys, fixtures.languages)), 'lookups')
+
+    video_info = main.fetch_download_links(fixtures.keys[0], fixtures.languages)
+    download_dir = os.path.join(work_dir, 'download')
+
+    def reset_download_dir():
+        shutil.rmtree(download_dir, ignore_errors=True)
+        os.makedirs(download_dir)
+
+    def download():
+        files = main.download_media(download_dir, main.media_urls(video_info))
+        return sum(os.path.getsize(path) for path in files.values())
+    stage('download', download, 'bytes', setup=reset_download_dir)
+
+    with open(os.path.join(fixtures.root, 'cdn', f"{fixtures.languages[-1]}.vtt"), 'rb') as f:
+        vtt_data = f.read()
+    stage('vtt', lambda: len(vtt_to_srt(vtt_data)), 'bytes')
+
+    chs_vtt = os.path.join(fixtures.root, 'cdn', 'CHS.vtt')
+    if os.path.exists(chs_vtt):
+        with open(chs_vtt, 'rb') as f:
+            cues = parse_vtt(f.read())
+        stage('pinyin', lambda: len(SubtitleProcessor().pinyin_cues(cues)), 'cues', setup=word_pinyin.cache_clear)
+    else:
+        skipped('pinyin', "CHS is not among the languages")
+
+    reset_download_dir()
+    files = main.prepare_subtitles(main.fetch_inputs(download_dir, video_info))
+    output_path = os.path.join(work_dir, 'output.mkv')
+    if mux_mode and fixtures.real_media:
+        def mux():
+            main.mux_video(video_info, files, output_path)
+            return os.path.getsize(output_path)
+        stage('mux', mux, 'bytes', subprocesses=True)
+    else:
+        skipped('mux', "needs ffmpeg to generate MP4s and mkvmerge or ffmpeg to mux")
+
+    # Zip and upload the muxed MKV the way a finished job ships it, or else the downloaded files
+    if os.path.exists(output_path):
+        entries = [(f"{key}.mkv", output_path) for key in fixtures.keys]
+    else:
+        entries = [(f"{role}.mkv", path) for role, path in files.items() if role.startswith('video_')] or \
+                  [(f"{role}.bin", path) for role, path in files.items()]
+    container = LocalContainerClient(os.path.join(work_dir, 'blobs'))
+    uploader = BlockUploader(block_size=main.UPLOAD_BLOCK_SIZE, concurrency=main.UPLOAD_CONCURRENCY)
+
+    def zip_upload():
+        blob_client = container.get_blob_client('bench.zip')
+        uploader.upload(blob_client, iter_zip(entries))
+        return os.path.getsize(blob_client.path)
+    stage('zip_upload', zip_upload, 'bytes')
+
+    if mux_mode and fixtures.real_media:
+        main._container_client = container
+        payload = {"videos": [{"data": {"title": key, "languageAgnosticNaturalKey": key}} for key in fixtures.keys],
+                   "languages": fixtures.languages}
+
+        def end_to_end():
+            main.process_job('bench', payload, lambda *args: None)
+            return len(fixtures.keys)
+        stage('end_to_end', end_to_end, 'videos', setup=main.mediator.clear, subprocesses=True)
+    else:
+        skipped('end_to_end', "needs a mux tool and real MP4s")
+
+    return results
+
+def compare(report, baseline, tolerance):
+    """
+    Print each stage against the baseline and return the names of regressed stages.
+    Raises ValueError if the baseline was recorded with a different configuration.
+    """
+    if report['config'] != baseline.get('config'):
+        differences = {key: (baseline.get('config', {}).get(key), value)
+                       for key, value in report['config'].items() if baseline.get('config', {}).get(key) != value}
+        raise ValueError(f"Baseline was recorded with a different configuration (baseline, this run): {differences}")
+    regressions = []
+    print(f"\nAgainst baseline (tolerance {tolerance:.0%}):")
+    for name, result in report['stages'].items():
+        base = baseline.get('stages', {}).get(name)
+        if base is None:
+            print(f"{name:>12}: no baseline")
+            continue
+        time_ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1.0
+        memory_ratio = result['peak_mb'] / base['peak_mb'] if base['peak_mb'] else 1.0
+        children_ratio = (result['children_peak_mb'] / base['children_peak_mb']
+                          if base.get('children_peak_mb') and 'children_peak_mb' in result else 1.0)
+        regressed = max(time_ratio, memory_ratio, children_ratio) > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:>12}: p50 {time_ratio:5.2f}x  peak {memory_ratio:5.2f}x  children {children_ratio:5.2f}x  "
+              f"{'REGRESSION' if regressed else 'ok'}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=3, help='videos per end-to-end job')
+    parser.add_argument('--languages', default='E,CHS', help='languages per video, first supplies the video')
+    parser.add_argument('--video-mb', type=float, default=8, help='size of the random stand-in MP4s without ffmpeg')
+    parser.add_argument('--video-seconds', type=int, default=30, help='length of generated MP4s with ffmpeg')
+    parser.add_argument('--catalog-items', type=int, default=20000, help='media items in the generated catalog')
+    parser.add_argument('--cues', type=int, default=600, help='cues per subtitle file')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per stage')
+    parser.add_argument('--mux-mode', choices=('mkvmerge', 'stream'),
+                        help='mux mode to benchmark (default: mkvmerge if installed, else stream)')
+    parser.add_argument('--save', help='write the results as JSON, e.g. to use as a baseline')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown or memory growth before failing')
+    args = parser.parse_args()
+
+    if args.mux_mode:
+        tool = 'mkvmerge' if args.mux_mode == 'mkvmerge' else 'ffmpeg'
+        if not shutil.which(tool):
+            parser.error(f"--mux-mode {args.mux_mode} needs {tool} on PATH")
+        mux_mode = args.mux_mode
+    elif shutil.which('mkvmerge'):
+        mux_mode = 'mkvmerge'
+    elif shutil.which('ffmpeg'):
+        mux_mode = 'stream'
+    else:
+        mux_mode = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixture_root, work_dir = os.path.join(tmp, 'fixtures'), os.path.join(tmp, 'work')
+        server = FixtureServer(fixture_root)
+        try:
+            configure_environment(work_dir, server.base_url, mux_mode)
+            fixtures = Fixtures(fixture_root, videos=args.videos, languages=args.languages.split(','),
+                                catalog_items=args.catalog_items, video_seconds=args.video_seconds,
+                                video_bytes=int(args.video_mb * 1024 * 1024), cues=args.cues).build(server.base_url)
+            print(f"Fixtures: {args.videos} videos x {args.languages}, "
+                  f"{'real' if fixtures.real_media else 'random-byte'} MP4s, mux mode {mux_mode or 'none'}")
+            results = run_stages(fixtures, server.base_url, work_dir, args.repeat, mux_mode)
+        finally:
+            server.close()
+
+    config = {key: value for key, value in vars(args).items() if key not in ('save', 'compare', 'tolerance', 'mux_mode')}
+    config.update(real_media=fixtures.real_media, mux_mode=mux_mode)
+    report = {"config": config, "stages": results}
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"\nSaved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.tolerance)
+        except ValueError as e:
+            print(f"\n{e}")
+            sys.exit(2)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
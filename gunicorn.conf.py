@@ -0,0 +1,26 @@
+import os
+import sys
+import time
+
+# Import the app once in the master and warm the jieba/pypinyin dictionaries there;
+# workers fork from it and share the loaded dictionaries copy-on-write
+preload_app = True
+
+# Threads don't survive fork(); each worker starts its own in post_fork
+os.environ.setdefault('DEFER_BACKGROUND_START', '1')
+
+def when_ready(server):
+    import warmup
+    warmup.warm_up()
+
+def post_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+    main = sys.modules['main']
+    # The WorkspaceManager was built once in the master, so sweep here for workspaces
+    # left by the worker this one replaces
+    main.workspaces.sweep()
+    main.start_background_workers()
+
+def post_worker_init(worker):
+    import warmup
+    warmup.record('worker_boot', time.perf_counter() - worker.forked_at)
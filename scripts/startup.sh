@@ -1 +1 @@
-gunicorn --chdir app main:app
\ No newline at end of file
+gunicorn --config gunicorn.conf.py --chdir app main:app
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import base64
+import random
+import threading
+import time
+
+import pytest
+
+from blob_upload import BlockUploader
+
+class MemoryBlobClient:
+    """The part of BlobClient that BlockUploader uses, kept in memory, with injectable failures."""
+    def __init__(self, failures=None, delay=0.0):
+        self.url = 'memory://blob'
+        self.blocks = {}
+        self.attempts = {}
+        self.committed = None
+        # {block number: how many times staging it fails before it succeeds}
+        self.failures = failures or {}
+        self.delay = delay
+        self.failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def stage_block(self, block_id, data, length=None):
+        with self._lock:
+            attempt = self.attempts.setdefault(block_id, 0)
+            self.attempts[block_id] += 1
+        number = int(base64.b64decode(block_id))
+        if self.delay:
+            # Finish blocks out of order
+            time.sleep(random.random() * self.delay)
+        if attempt < self.failures.get(number, 0):
+            self.failed.set()
+            raise IOError(f"Injected failure staging block {number}")
+        assert length == len(data)
+        with self._lock:
+            self.blocks[block_id] = bytes(data)
+
+    def commit_block_list(self, block_list, content_settings=None):
+        self.committed = b''.join(self.blocks[block.id] for block in block_list)
+
+def chunked(data, size):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+@pytest.fixture
+def payload():
+    # Not a multiple of the block size, so the last block is short
+    return os.urandom(10 * 1024 + 123)
+
+def test_blocks_are_committed_in_order(payload):
+    client = MemoryBlobClient(delay=0.01)
+    uploader = BlockUploader(block_size=1024, concurrency=4, backoff=0)
+    assert uploader.upload(client, chunked(payload, 700)) == client.url
+    assert client.committed == payload
+    assert len(client.blocks) == 11
+
+def test_failed_blocks_are_retried_on_their_own(payload):
+    client = MemoryBlobClient(failures={0: 1, 3: 2, 10: 3}, delay=0.005)
+    uploader = BlockUploader(block_size=1024, concurrency=4, max_retries=3, backoff=0)
+    uploader.upload(client, chunked(payload, 4096))
+    assert client.committed == payload
+    attempts = {int(base64.b64decode(block_id)): n for block_id, n in client.attempts.items()}
+    assert attempts == {number: 1 + {0: 1, 3: 2, 10: 3}.get(number, 0) for number in range(11)}
+
+def test_gives_up_and_stops_producing_after_a_block_fails(payload):
+    client = MemoryBlobClient(failures={1: 99})
+    uploader = BlockUploader(block_size=1024, concurrency=2, max_retries=1, backoff=0)
+    produced = []
+
+    def chunks():
+        for i, chunk in enumerate(chunked(payload * 10, 1024)):
+            produced.append(i)
+            if i >= 2:
+                client.failed.wait(5)
+                time.sleep(0.05)
+            yield chunk
+
+    with pytest.raises(IOError):
+        uploader.upload(client, chunks())
+    assert client.committed is None
+    assert len(produced) < 10
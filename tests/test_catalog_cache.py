@@ -0,0 +1,142 @@
+import gzip
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from catalog_cache import CatalogCache
+
+def catalog_bytes(titles):
+    lines = [json.dumps({"type": "media-item", "o": {
+        "title": title,
+        "languageAgnosticNaturalKey": f"pub-test_{i}_VIDEO",
+        "keyParts": {"formatCode": "VIDEO"},
+    }}) for i, title in enumerate(titles)]
+    return gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+
+class CatalogServer:
+    """Serves one catalog with an ETag, answering 304 to a matching If-None-Match."""
+    def __init__(self):
+        self.body = b''
+        self.etag = None
+        self.requests = []
+        self.status = 200
+        self.gate = threading.Event()
+        self.gate.set()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(dict(self.headers))
+                server.gate.wait()
+                if server.status != 200:
+                    self.send_response(server.status)
+                    self.end_headers()
+                    return
+                if self.headers.get('If-None-Match') == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', server.etag)
+                self.send_header('Content-Length', str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/E.json.gz"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def publish(self, titles, etag):
+        self.body = catalog_bytes(titles)
+        self.etag = etag
+
+    def close(self):
+        self.gate.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    server = CatalogServer()
+    yield server
+    server.close()
+
+def settle(cache):
+    """Stop further refreshes and wait for one in progress, before the server goes away."""
+    cache.ttl = 3600
+    for _ in range(100):
+        if not cache._refreshing:
+            return
+        threading.Event().wait(0.05)
+
+def titles(index):
+    return sorted(hit['title'] for hit in index.search('')['items'])
+
+def test_revalidates_with_etag(server, tmp_path):
+    server.publish(["Hope", "Faith"], '"v1"')
+    cache = CatalogCache(server.url, cache_dir=tmp_path, ttl=0)
+
+    first = cache.get_index()
+    assert titles(first) == ["Faith", "Hope"]
+    assert 'If-None-Match' not in server.requests[0]
+
+    # Unchanged catalog: a conditional request, answered 304, keeps the same index
+    assert cache.refresh() is first
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+
+    # Changed catalog: downloaded and indexed again
+    server.publish(["Hope", "Faith", "Love"], '"v2"')
+    second = cache.refresh()
+    assert second is not first
+    assert titles(second) == ["Faith", "Hope", "Love"]
+    assert titles(cache.get_index()) == ["Faith", "Hope", "Love"]
+    settle(cache)
+
+def test_serves_current_index_while_revalidating(server, tmp_path):
+    server.publish(["Hope"], '"v1"')
+    cache = CatalogCache(server.url, cache_dir=tmp_path, ttl=0)
+    first = cache.get_index()
+
+    # The CDN hangs; searches keep getting the loaded index instead of waiting for it
+    server.gate.clear()
+    server.publish(["Hope", "Love"], '"v2"')
+    assert cache.get_index() is first
+    assert cache.get_index() is first
+
+    server.gate.set()
+    for _ in range(100):
+        if titles(cache.get_index()) == ["Hope", "Love"]:
+            break
+        threading.Event().wait(0.05)
+    assert titles(cache.get_index()) == ["Hope", "Love"]
+    settle(cache)
+
+def test_backs_off_while_the_cdn_fails(server, tmp_path):
+    server.publish(["Hope"], '"v1"')
+    cache = CatalogCache(server.url, cache_dir=tmp_path, ttl=0, retry_after=3600)
+    first = cache.get_index()
+
+    server.status = 404
+    assert cache.refresh() is first
+    failures = len(server.requests)
+
+    # Searches keep the cached copy and don't start another attempt until retry_after has passed
+    for _ in range(5):
+        assert cache.get_index() is first
+    assert not cache._refreshing
+    assert len(server.requests) == failures
+
+    # Other workers read the retry time from the shared meta file
+    other = CatalogCache(server.url, cache_dir=tmp_path, ttl=0, retry_after=3600)
+    assert titles(other.get_index()) == ["Hope"]
+    assert len(server.requests) == failures
+
+def test_first_load_fails_without_a_cached_copy(tmp_path):
+    cache = CatalogCache("http://127.0.0.1:1/E.json.gz", cache_dir=tmp_path, timeout=1)
+    with pytest.raises(Exception):
+        cache.get_index()
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from jobs import JobQueue, QueueFull, JobTooLarge, QUEUED, RUNNING, DONE, FAILED
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / 'jobs.sqlite3'), handler=None, **kwargs)
+
+def enqueue(queue, name, cost=0):
+    job_id = queue.enqueue({"name": name}, [name], cost=cost)
+    # created_at orders the queue; keep it strictly increasing
+    time.sleep(0.002)
+    return job_id
+
+def claimed_name(queue):
+    claimed = queue._claim()
+    return None if claimed is None else claimed[1]['name']
+
+def set_column(queue, job_id, column, value):
+    with queue._connect() as conn:
+        conn.execute(f"UPDATE jobs SET {column} = ? WHERE id = ?", (value, job_id))
+
+def test_claims_oldest_first_up_to_the_concurrency_cap(tmp_path):
+    queue = make_queue(tmp_path, concurrency=2)
+    first, second, third = (enqueue(queue, name) for name in ('a', 'b', 'c'))
+
+    assert claimed_name(queue) == 'a'
+    assert claimed_name(queue) == 'b'
+    assert claimed_name(queue) is None
+    assert queue.get(third)['position'] == 0
+
+    queue._finish(first, DONE, result='url')
+    assert claimed_name(queue) == 'c'
+    assert queue.get(first)['status'] == DONE
+    assert queue.get(second)['status'] == RUNNING
+
+def test_byte_budget_holds_the_head_of_the_queue(tmp_path):
+    queue = make_queue(tmp_path, concurrency=4, max_bytes=100)
+    big = enqueue(queue, 'big', cost=70)
+    enqueue(queue, 'medium', cost=50)
+    enqueue(queue, 'small', cost=10)
+
+    assert claimed_name(queue) == 'big'
+    # 'medium' doesn't fit next to 'big', and 'small' may not overtake it
+    assert claimed_name(queue) is None
+    assert queue.stats() == {"queued": 2, "queued_bytes": 60, "running": 1, "running_bytes": 70}
+
+    queue._finish(big, DONE)
+    assert claimed_name(queue) == 'medium'
+    assert claimed_name(queue) == 'small'
+
+def test_rejects_when_full_or_too_large(tmp_path):
+    queue = make_queue(tmp_path, max_bytes=100, max_queued=2, retry_after=7)
+    with pytest.raises(JobTooLarge):
+        queue.enqueue({}, ['huge'], cost=101)
+    enqueue(queue, 'a')
+    enqueue(queue, 'b')
+    with pytest.raises(QueueFull) as excinfo:
+        queue.check_capacity()
+    assert excinfo.value.retry_after == 7
+    with pytest.raises(QueueFull):
+        queue.enqueue({}, ['c'])
+    assert queue.stats()['queued'] == 2
+
+def test_stale_jobs_are_requeued_until_max_attempts(tmp_path):
+    queue = make_queue(tmp_path, concurrency=1, stale_after=60, max_attempts=2)
+    job_id = enqueue(queue, 'a')
+
+    for attempt in (1, 2):
+        assert claimed_name(queue) == 'a'
+        # The worker running it dies: its heartbeat stops
+        set_column(queue, job_id, 'heartbeat', time.time() - 120)
+
+    assert claimed_name(queue) is None
+    job = queue.get(job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == 'Worker stopped responding'
+
+def test_purge_deletes_only_old_finished_jobs(tmp_path):
+    queue = make_queue(tmp_path, retention=3600)
+    old_done, old_failed, recent_done, queued = (enqueue(queue, name) for name in ('a', 'b', 'c', 'd'))
+    queue._finish(old_done, DONE)
+    queue._finish(old_failed, FAILED, error='boom')
+    queue._finish(recent_done, DONE)
+    for job_id in (old_done, old_failed, queued):
+        set_column(queue, job_id, 'updated_at', time.time() - 7200)
+
+    assert queue.purge() == 2
+    assert queue.get(old_done) is None and queue.get(old_failed) is None
+    assert queue.get(recent_done)['status'] == DONE
+    assert queue.get(queued)['status'] == QUEUED
+    # Progress reports for a purged job are ignored
+    queue.report(old_done, 0, 'muxing', 0.5)
@@ -0,0 +1,132 @@
+import os
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+from media_cache import FileCache, cache_key
+
+def slow_fill(content, calls=None, delay=0.2):
+    def fill(path):
+        if calls is not None:
+            calls.append(path)
+        time.sleep(delay)
+        with open(path, 'wb') as f:
+            f.write(content)
+    return fill
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_concurrent_fetches_fill_once(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    key = cache_key('https://cdn/video.mp4', 'checksum', 3)
+    calls = []
+    results = []
+
+    def fetch(i):
+        dest = str(tmp_path / f"dest{i}")
+        results.append((cache.fetch_to(key, dest, slow_fill(b'abc', calls)), read(dest)))
+
+    threads = [threading.Thread(target=fetch, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [(False, b'abc')] + [(True, b'abc')] * 7
+    assert cache.stats()['hits'] == 7 and cache.stats()['misses'] == 1
+    # The fill claim leaves nothing behind
+    assert not [name for name in os.listdir(cache.locks_dir) if name.endswith('.fill')]
+
+def _fetch_in_process(cache_dir, key, dest, marker_dir):
+    cache = FileCache(cache_dir, max_bytes=10 ** 6)
+
+    def fill(path):
+        open(os.path.join(marker_dir, str(os.getpid())), 'w').close()
+        time.sleep(0.3)
+        with open(path, 'wb') as f:
+            f.write(b'shared')
+
+    cache.fetch_to(key, dest, fill)
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork for the worker processes")
+def test_concurrent_processes_fill_once(tmp_path):
+    markers = tmp_path / 'markers'
+    markers.mkdir()
+    key = cache_key('shared')
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_fetch_in_process,
+                                 args=(str(tmp_path / 'cache'), key, str(tmp_path / f"dest{i}"), str(markers)))
+                 for i in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(30)
+        assert p.exitcode == 0
+    assert len(os.listdir(markers)) == 1
+    assert all(read(tmp_path / f"dest{i}") == b'shared' for i in range(4))
+
+def test_unrelated_keys_do_not_wait_for_each_other(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    started = time.perf_counter()
+    threads = [threading.Thread(target=cache.fetch_to,
+                                args=(cache_key(i), str(tmp_path / f"dest{i}"), slow_fill(b'x', delay=0.5)))
+               for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert time.perf_counter() - started < 1.5
+
+def test_failed_fill_lets_the_next_caller_retry(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    key = cache_key('flaky')
+
+    def broken(path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise IOError("download failed")
+
+    with pytest.raises(IOError):
+        cache.fetch_to(key, str(tmp_path / 'a'), broken)
+    assert not cache.contains(key)
+    assert cache.fetch_to(key, str(tmp_path / 'b'), slow_fill(b'ok', delay=0)) is False
+    assert read(tmp_path / 'b') == b'ok'
+    assert not [name for name in os.listdir(os.path.dirname(cache.path_for(key))) if name.endswith('.part')]
+
+def test_eviction_is_lru_and_skips_locked_and_kept_entries(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    keys = [cache_key(i) for i in range(4)]
+    for i, key in enumerate(keys):
+        cache.fetch_to(key, str(tmp_path / f"dest{i}"), slow_fill(b'x' * 100, delay=0))
+        # Oldest use first
+        os.utime(cache.path_for(key), (1000 + i, 1000 + i))
+
+    cache.max_bytes = 200
+    # keys[0] is the least recently used but is being linked right now; keys[1] is kept
+    with cache._lock(keys[0]):
+        evictor = threading.Thread(target=cache.evict, kwargs={'keep': keys[1]})
+        evictor.start()
+        evictor.join()
+
+    assert [cache.contains(key) for key in keys] == [True, True, False, False]
+    assert cache.stats()['evictions'] == 2
+
+def test_stale_part_files_are_removed(tmp_path):
+    cache = FileCache(str(tmp_path / 'cache'), max_bytes=10 ** 6, stale_part_age=60)
+    key = cache_key('entry')
+    cache.fetch_to(key, str(tmp_path / 'dest'), slow_fill(b'data', delay=0))
+    shard = os.path.dirname(cache.path_for(key))
+    stale, fresh = os.path.join(shard, f"{key}.old.part"), os.path.join(shard, f"{key}.new.part")
+    for path in (stale, fresh):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+    os.utime(stale, (time.time() - 120, time.time() - 120))
+
+    assert cache.stats()['files'] == 1
+    assert not os.path.exists(stale)
+    assert os.path.exists(fresh)
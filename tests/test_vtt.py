@@ -0,0 +1,57 @@
+from vtt import Cue, parse_vtt, vtt_to_srt
+
+def test_cue_settings_and_identifiers_are_dropped():
+    data = (b"WEBVTT\n\n"
+            b"intro\n"
+            b"00:00:01.000 --> 00:00:02.500 align:start position:10% line:0\n"
+            b"Hello\n")
+    assert parse_vtt(data) == [Cue('00:00:01,000', '00:00:02,500', ['Hello'])]
+
+def test_note_style_and_region_blocks_are_skipped():
+    data = (b"WEBVTT - with blocks\n\n"
+            b"REGION\nid:bottom width:40%\n\n"
+            b"STYLE\n::cue {\n  color: yellow;\n}\n\n"
+            b"NOTE a comment\nspanning lines\n\n"
+            b"00:00:01.000 --> 00:00:02.000\nFirst\n\n"
+            b"NOTE\nbetween cues\n\n"
+            b"00:00:03.000 --> 00:00:04.000\nSecond\n")
+    assert [cue.lines for cue in parse_vtt(data)] == [['First'], ['Second']]
+
+def test_multi_line_cues_keep_their_lines():
+    data = (b"WEBVTT\n\n"
+            b"00:00:01.000 --> 00:00:02.000\n"
+            b"<v Anna>First line</v>\n"
+            b"<i.loud>second</i> &amp; <c.yellow>third</c>\n\n"
+            b"00:00:03.000 --> 00:00:04.000\nNext\n")
+    cues = parse_vtt(data)
+    assert cues[0].lines == ['First line', '<i>second</i> & third']
+    assert cues[1].lines == ['Next']
+
+def test_timestamps_without_hours_or_with_long_hours():
+    data = (b"WEBVTT\n\n"
+            b"01:02.003 --> 01:04.500\nShort\n\n"
+            b"123:00:00.000 --> 123:00:01.000\nLong\n")
+    cues = parse_vtt(data)
+    assert (cues[0].start, cues[0].end) == ('00:01:02,003', '00:01:04,500')
+    assert (cues[1].start, cues[1].end) == ('123:00:00,000', '123:00:01,000')
+
+def test_empty_cues_are_skipped():
+    data = (b"WEBVTT\n\n"
+            b"00:00:01.000 --> 00:00:02.000\n\n"
+            b"00:00:02.000 --> 00:00:03.000\n<c.blank></c>\n\n"
+            b"00:00:03.000 --> 00:00:04.000\n   \n\n"
+            b"00:00:04.000 --> 00:00:05.000\nKept\n")
+    assert [cue.lines for cue in parse_vtt(data)] == [['Kept']]
+
+def test_crlf_and_cr_line_endings():
+    lf = b"WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nOne\nTwo\n\n00:00:03.000 --> 00:00:04.000\nThree\n"
+    expected = parse_vtt(lf)
+    assert len(expected) == 2
+    assert parse_vtt(lf.replace(b'\n', b'\r\n')) == expected
+    assert parse_vtt(lf.replace(b'\n', b'\r')) == expected
+    assert parse_vtt(b'\xef\xbb\xbf' + lf.replace(b'\n', b'\r\n')) == expected
+
+def test_vtt_to_srt_numbers_cues():
+    data = b"WEBVTT\n\n00:01.000 --> 00:02.000\nOne\n\n00:03.000 --> 00:04.000\nTwo\nlines\n"
+    assert vtt_to_srt(data) == (b"1\n00:00:01,000 --> 00:00:02,000\nOne\n\n"
+                                b"2\n00:00:03,000 --> 00:00:04,000\nTwo\nlines\n\n")
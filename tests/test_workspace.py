@@ -0,0 +1,30 @@
+import pytest
+
+from workspace import WorkspaceManager, QuotaExceeded
+
+def write(path, nbytes):
+    with open(path, 'wb') as f:
+        f.write(b'\0' * nbytes)
+
+def test_true_up_reserves_space_used_beyond_the_reservation(tmp_path):
+    manager = WorkspaceManager(str(tmp_path), quota_bytes=10000)
+    workspace = manager.create()
+    workspace.reserve(1000)
+    write(workspace.subdir('video') + '/video.mp4', 4000)
+
+    workspace.true_up()
+    assert workspace.reserved >= 4000
+
+    write(workspace.subdir('video') + '/output.mkv', 8000)
+    with pytest.raises(QuotaExceeded):
+        workspace.true_up()
+
+def test_true_up_counts_against_the_volume_total(tmp_path):
+    manager = WorkspaceManager(str(tmp_path), total_bytes=10000)
+    first = manager.create()
+    first.reserve(6000)
+    second = manager.create()
+    write(second.subdir('video') + '/video.mp4', 5000)
+
+    with pytest.raises(QuotaExceeded):
+        second.true_up()